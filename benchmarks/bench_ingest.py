@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the ERDDAP csv ingest used by "clim.py"
+compares the old per-row dateutil loop with the vectorized loader in "emolt_erddap.py"
+on a synthetic 30-year hourly csv shaped like the eMOLT tabledap response
+
+run from the top directory as: python -m benchmarks.bench_ingest [nyears]
+"""
+import sys
+import io
+import time
+import numpy as np
+import pandas as pd
+from dateutil.parser import parse
+from emolt_erddap import erddap_cols,parse_time,obs_frame
+
+def synthetic_csv(nyears=30,freq='h',start='1994-01-01'):
+    # hourly bottom temperatures with a seasonal cycle as the text ERDDAP would send
+    t=pd.date_range(start,periods=int(nyears*365.25*pd.Timedelta('1D')/pd.Timedelta(pd.tseries.frequencies.to_offset(freq))),freq=freq,tz='UTC')
+    temp=10+6*np.sin(2*np.pi*t.dayofyear.values/365.25)+np.random.default_rng(0).normal(0,0.5,len(t))
+    df=pd.DataFrame({erddap_cols[0]:t.strftime('%Y-%m-%dT%H:%M:%SZ'),erddap_cols[1]:30.,erddap_cols[2]:temp.round(3)})
+    return df.to_csv(index=False)
+
+def ingest_before(text):
+    # what clim.py used to do
+    df=pd.read_csv(io.StringIO(text))
+    temp=1.8*df[erddap_cols[2]].values+32
+    depth=df[erddap_cols[1]].values
+    time=[]
+    for k in range(len(df)):
+        time.append(parse(df[erddap_cols[0]][k]))
+    return pd.DataFrame({'temp':temp,'Depth':depth},index=time)
+
+def ingest_after(text):
+    df=pd.read_csv(io.StringIO(text))
+    return obs_frame(parse_time(df[erddap_cols[0]]),df[erddap_cols[1]].values,df[erddap_cols[2]].values)
+
+def rows_per_second(func,text,nrows):
+    t0=time.perf_counter()
+    func(text)
+    return nrows/(time.perf_counter()-t0)
+
+if __name__=='__main__':
+    nyears=float(sys.argv[1]) if len(sys.argv)>1 else 30
+    text=synthetic_csv(nyears)
+    nrows=text.count('\n')-1
+    print('%d rows (%g years hourly)' % (nrows,nyears))
+    before=rows_per_second(ingest_before,text,nrows)
+    after=rows_per_second(ingest_after,text,nrows)
+    print('before: %12.0f rows/s' % before)
+    print('after:  %12.0f rows/s  (%.1fx)' % (after,after/before))
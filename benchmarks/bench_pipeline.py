@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the "clim.py" pipeline on synthetic eMOLT-shaped records served by a local stand-in for ERDDAP
+
+For each record length (years), number of sites, and sampling (hourly, or 2-hourly as at the DMF sites)
+it times, in a fresh process so the peak memory is that case's own:
+  ingest       download through the stand-in, parse, and write the cache (emolt_erddap.getobs_latlon_cached)
+  aggregate    daily, monthly, and annual stats (emolt_agg.period_frames)
+  climatology  masks and the daily and monthly climatologies (emolt_agg.aggregate_frames)
+  csv          the five csv products of clim.py
+  npz          the typed columnar copy (emolt_output.py)
+and reports each stage's throughput (observations per second, best of "--repeat") and the peak memory.
+
+With a baseline saved by "--save-baseline" (on the same machine), it fails (exit status 1)
+when a stage's throughput drops by more than "--threshold" from it.
+
+run from the top directory as: python -m benchmarks.bench_pipeline [--years 1 10 30] [--sites 1 4] [--hours 1 2]
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+stages=['ingest','aggregate','climatology','csv','npz']
+baseline_file=os.path.join(os.path.dirname(os.path.abspath(__file__)),'baseline.json')
+
+def run_case(nyears,nsites,hours,repeat=3):
+    # times the stages for "nsites" synthetic sites (run in its own process, see "bench")
+    import clim
+    from emolt_erddap import getobs_latlon_cached,cache_file
+    from emolt_agg import period_frames,aggregate_frames
+    from emolt_timing import setup,stage,records,peak_rss_mb
+    from benchmarks.synthetic import synthetic_record,serve
+    tmp=tempfile.mkdtemp()
+    try:
+        names=[('DMF%d' if hours==2 else 'SY%02d') % (k+1) for k in range(nsites)] # DMF sites get the 2-hourly thresholds
+        latlons=[(4100.+k,-7000.) for k in range(nsites)]
+        sites={latlon:synthetic_record(nyears,hours,seed=k) for k,latlon in enumerate(latlons)}
+        nobs=sum(len(rows[0]) for rows in sites.values())
+        pd.DataFrame({'SITE':names,'LAT_DDMM':[x[0] for x in latlons],'LON_DDMM':[x[1] for x in latlons]}).to_csv(os.path.join(tmp,'sites.csv'),index=False)
+        clim.site_lookup=os.path.join(tmp,'sites.csv')
+        clim.cachedir=tmp+'/'
+        clim.outdir=tmp+'/'
+        server,url=serve(sites)
+        setup(True)
+        best={}
+        peak=0.
+        for r in range(repeat):
+            del records[:]
+            for site,(lat,lon) in zip(names,latlons):
+                if os.path.exists(cache_file(clim.cachedir,lat,lon)):
+                    os.remove(cache_file(clim.cachedir,lat,lon)) # a full download every time
+                with stage(site,'ingest'):
+                    df=getobs_latlon_cached(lat,lon,clim.cachedir,url)
+                [numperday,minnumperday]=clim.getsite_numperday(site)
+                with stage(site,'aggregate'):
+                    frames=period_frames(df.index.values,df.temp.values)
+                with stage(site,'climatology'):
+                    aggregate_frames(frames,minnumperday,clim.mindayspermonth*numperday,site)
+                clim.clim_site(site,df,None,True,['npz']) # times its "csv" and "output" stages
+            timed=pd.DataFrame(records).replace({'stage':{'output':'npz'}})
+            seconds=timed.groupby('stage')['seconds'].sum()
+            peak=max(peak,pd.to_numeric(timed['stage_peak_rss_mb']).fillna(0).max(),peak_rss_mb() or 0) # each stage restarts the kernel's peak (see "emolt_timing.py")
+            for k in stages:
+                best[k]=min(best.get(k,float('inf')),seconds[k])
+        server.shutdown()
+        return {'years':nyears,'sites':nsites,'hours':hours,'observations':nobs,'peak_rss_mb':peak,
+                **{k+'_obs_per_s':nobs/best[k] for k in stages}}
+    finally:
+        shutil.rmtree(tmp,ignore_errors=True)
+
+def bench(years,nsites,hours,repeat=3):
+    # runs every case, each in a new process, returning a dataframe of one row per case
+    rows=[]
+    for case in itertools.product(years,nsites,hours):
+        with ProcessPoolExecutor(1,mp_context=multiprocessing.get_context('spawn')) as pool:
+            rows.append(pool.submit(run_case,*case,repeat).result())
+        print('%gy %d site(s) every %dh: %d observations' % (case[0],case[1],case[2],rows[-1]['observations']),flush=True)
+    return pd.DataFrame(rows)
+
+def case_key(row):
+    return '%gy_%dsites_%dh' % (row['years'],row['sites'],row['hours'])
+
+def regressions(df,baseline,threshold):
+    # the stages of the cases in "baseline" that are slower than it by more than "threshold" (a fraction)
+    slow=[]
+    for _,row in df.iterrows():
+        old=baseline.get(case_key(row))
+        if old is None:
+            continue
+        for k in stages:
+            col=k+'_obs_per_s'
+            if row[col]<(1-threshold)*old[col]:
+                slow.append('%s %s: %.0f obs/s vs %.0f in the baseline' % (case_key(row),k,row[col],old[col]))
+    return slow
+
+if __name__=='__main__':
+    parser=argparse.ArgumentParser(description='time the clim.py pipeline on synthetic eMOLT records')
+    parser.add_argument('--years',type=float,nargs='+',default=[1,10,30],help='record lengths')
+    parser.add_argument('--sites',type=int,nargs='+',default=[1,4],help='numbers of sites')
+    parser.add_argument('--hours',type=int,nargs='+',default=[1,2],help='sampling intervals (2 is DMF-style)')
+    parser.add_argument('--repeat',type=int,default=3,help='times each case is run (the fastest is kept)')
+    parser.add_argument('--baseline',default=baseline_file,help='json of earlier results to compare with')
+    parser.add_argument('--save-baseline',action='store_true',help='save these results as the baseline instead of comparing')
+    parser.add_argument('--threshold',type=float,default=0.25,help='fractional drop in throughput that counts as a regression')
+    parser.add_argument('--json',help='also save the results to this file')
+    args=parser.parse_args()
+    df=bench(args.years,args.sites,args.hours,args.repeat)
+    pd.set_option('display.width',200)
+    print(df.to_string(index=False,float_format=lambda x: '%.4g' % x))
+    results={case_key(row):row for row in json.loads(df.to_json(orient='records'))}
+    if args.json:
+        with open(args.json,'w') as f:
+            json.dump(results,f,indent=1)
+    if args.save_baseline:
+        baseline=json.load(open(args.baseline)) if os.path.exists(args.baseline) else {}
+        baseline.update(results)
+        with open(args.baseline,'w') as f:
+            json.dump(baseline,f,indent=1)
+        print('baseline saved to '+args.baseline)
+    elif not os.path.exists(args.baseline):
+        print('no baseline to compare with, run with --save-baseline first')
+    else:
+        slow=regressions(df,json.load(open(args.baseline)),args.threshold)
+        for s in slow:
+            print('REGRESSION '+s)
+        sys.exit(1 if slow else 0)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic eMOLT-shaped bottom temperature records and a local stand-in for the NEFSC ERDDAP server
+so the pipeline of "clim.py" can be timed without the network
+
+A record starts and ends part way through a month, runs across leap years, and has the instrument
+out of the water now and then (gaps of days to weeks) as well as single missing samples.
+The stand-in keeps connections open and gzips when asked, as ERDDAP does, and can be made to
+answer late ("StandIn.delay") or fail ("StandIn.failures") to exercise the retries of "emolt_erddap.ErddapClient"
+(see "tests/test_erddap.py"), and redirects the paths starting with "/moved" (to the rest of the path) and "/loop" (to themselves).
+"""
+import re
+import sys
+import gzip
+import time
+import threading
+import numpy as np
+import pandas as pd
+from http.server import BaseHTTPRequestHandler,ThreadingHTTPServer
+from urllib.parse import unquote,urlsplit
+from emolt_erddap import erddap_cols
+
+def synthetic_record(nyears,hours=1,start='2003-11-17T05',seed=0,gapfrac=0.05):
+    """
+    returns time (datetime64[s] UTC), depth (m), and temperature (degC) sampled every "hours"
+    for "nyears" from "start" (by default mid-month and with Feb 29 2004 in the first year)
+    with about "gapfrac" of the time missing in gaps of 1 to 40 days
+    """
+    rng=np.random.default_rng(seed)
+    t0=np.datetime64(start,'s')
+    step=np.timedelta64(hours,'h')
+    t=t0+step*np.arange(int(nyears*365.25*24/hours))
+    keep=rng.random(len(t))>0.01 # single missing samples
+    ngaps=int(gapfrac*nyears*365.25/20)
+    for first,length in zip(rng.integers(0,len(t),ngaps),rng.integers(1,41,ngaps)):
+        keep[first:first+length*24//hours]=False
+    t=t[keep]
+    yearday=(t-t.astype('datetime64[Y]')).astype('timedelta64[h]').astype(float)/24
+    temp=10+6*np.sin(2*np.pi*(yearday-100)/365.25)+rng.normal(0,0.5,len(t))
+    depth=30+rng.normal(0,0.2,len(t))
+    return t,depth.round(1),temp.round(3)
+
+def erddap_text(time,depth,temp):
+    # the csvp text ERDDAP would send for these rows
+    df=pd.DataFrame({erddap_cols[0]:np.datetime_as_string(time,unit='s')+'Z',erddap_cols[1]:depth,erddap_cols[2]:temp})
+    return df.to_csv(index=False).encode()
+
+class StandIn(BaseHTTPRequestHandler):
+    """
+    answers the tabledap queries of "emolt_erddap.getobs_url" from the records in "sites"
+    as {(lat,lon): (time,depth,temp)} including "time>" for the rows since the last cached time,
+    the orderByCount and orderByMinMax summaries of "emolt_erddap.getbox_url" for the survey,
+    and a 404 when nothing matches (or for any dataset but eMOLT), as ERDDAP does
+    where the next "failures" requests get a 503 (or, if "drop" is set, the connection is closed part way through the body)
+    and every answer waits "delay" seconds
+    The path of the last request is kept in "last_path" (the whole url when it came through as a proxy).
+    """
+    protocol_version='HTTP/1.1' # keep-alive
+    sites={}
+    bodies={} # the whole record of each site as text, made before the timing starts
+    gzipped={}
+    delay=0.
+    failures=0
+    drop=False
+    requests=0
+    connections=set()
+    last_path=None
+
+    def do_GET(self):
+        StandIn.requests+=1
+        StandIn.connections.add(self.client_address)
+        StandIn.last_path=self.path
+        time.sleep(self.delay)
+        path=urlsplit(self.path).path
+        if path.startswith('/moved') or path.startswith('/loop'): # as when a server moves a dataset (or is misconfigured)
+            self.send_response(301)
+            self.send_header('Location',self.path[len('/moved'):] if path.startswith('/moved') else self.path)
+            self.send_header('Content-Length','0')
+            self.end_headers()
+            return
+        if StandIn.failures>0 and not self.drop:
+            StandIn.failures-=1
+            self.send_error(503,'Service Unavailable')
+            return
+        if not path.endswith('/eMOLT.csvp'): # as ERDDAP answers for a dataset it does not have
+            self.send_error(404,'Not Found: Currently unknown datasetID='+path.split('/')[-1].split('.')[0])
+            return
+        query=unquote(self.path)
+        if 'orderByCount' in query or 'orderByMinMax' in query:
+            body,whole=self.summary(query),None
+        else:
+            body,whole=self.record(query)
+        if body is None:
+            self.send_error(404,'Your query produced no matching results.')
+            return
+        self.send_response(200)
+        self.send_header('Content-Type','text/csv')
+        if 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+            if whole is not None:
+                if whole not in self.gzipped:
+                    self.gzipped[whole]=gzip.compress(body,compresslevel=1)
+                body=self.gzipped[whole]
+            else:
+                body=gzip.compress(body,compresslevel=1)
+            self.send_header('Content-Encoding','gzip')
+        self.send_header('Content-Length',str(len(body)))
+        self.end_headers()
+        if StandIn.failures>0: # and self.drop
+            StandIn.failures-=1
+            self.wfile.write(body[:len(body)//2])
+            self.close_connection=True
+            return
+        self.wfile.write(body)
+
+    def record(self,query):
+        # the text of one site's rows (since "time>" if given) and its (lat,lon) when it is the whole record, or None if there are none
+        lat=float(re.search(r'latitude=([-\d.]+)',query).group(1))
+        lon=float(re.search(r'longitude=([-\d.]+)',query).group(1))
+        since=re.search(r'time>([^&]+)',query)
+        rows=self.sites.get((lat,lon))
+        if rows is not None and since is not None:
+            i=np.searchsorted(rows[0],np.datetime64(since.group(1).rstrip('Z'),'s'),side='right')
+            rows=[x[i:] for x in rows]
+        if rows is None or len(rows[0])==0:
+            return None,None
+        if since is None:
+            return self.bodies[(lat,lon)],(lat,lon)
+        return erddap_text(*rows),None
+
+    def summary(self,query):
+        """
+        the text of "orderByCount" (the rows of each lat/lon) or "orderByMinMax" (its first and last time)
+        over the sites in the box of "latitude>=" ... "longitude<=" as in "emolt_erddap.getbox_url", or None if there are none
+        where lat/lon are written with 4 decimals (as ERDDAP might, unlike the site table)
+        """
+        bound=lambda name: float(re.search(name+r'([-\d.]+)',query).group(1))
+        inbox=[(k,rows[0]) for k,rows in sorted(self.sites.items()) if len(rows[0])>0 and
+               bound('latitude>=')<=k[0]<=bound('latitude<=') and bound('longitude>=')<=k[1]<=bound('longitude<=')]
+        if not inbox:
+            return None
+        if 'orderByCount' in query:
+            lines=['latitude (degrees_north),longitude (degrees_east),time (count)']
+            lines+=['%.4f,%.4f,%d' % (lat,lon,len(t)) for (lat,lon),t in inbox]
+        else:
+            lines=['latitude (degrees_north),longitude (degrees_east),time (UTC)']
+            for (lat,lon),t in inbox:
+                lines+=['%.4f,%.4f,%sZ' % (lat,lon,np.datetime_as_string(x,unit='s')) for x in [t.min(),t.max()]]
+        return ('\n'.join(lines)+'\n').encode()
+
+    def log_message(self,*args):
+        pass
+
+class Server(ThreadingHTTPServer):
+    daemon_threads=True
+    def handle_error(self,request,client_address):
+        if not isinstance(sys.exc_info()[1],ConnectionError): # a client that gave up (timed out) is expected here
+            super().handle_error(request,client_address)
+
+def serve(sites):
+    """
+    starts the stand-in on a free local port for {(lat,lon): (time,depth,temp)}
+    returning the server (call its shutdown() when done) and the url to use in place of "erddap_url"
+    """
+    StandIn.sites=sites
+    StandIn.bodies={k:erddap_text(*rows) for k,rows in sites.items()}
+    StandIn.gzipped={}
+    server=Server(('127.0.0.1',0),StandIn)
+    threading.Thread(target=server.serve_forever,daemon=True).start()
+    return server,'http://127.0.0.1:'+str(server.server_port)+'/erddap/tabledap/eMOLT.csvp'
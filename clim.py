@@ -28,71 +28,162 @@ site_lookup='/home/user/emolt_non_realtime/emolt/emolt_site.csv' # has lat/lon f
 #outdir='/net/pubweb_html/epd/ocean/MainPage/lob/' #this is where I stored the output files and plots on my network
 outdir='./output/' #this is where I stored the output files and plots on my network
 pltdir='./plots/'
+cachedir='./cache/' # local copy of each site's ERDDAP data so reruns only fetch the new rows
+chunksize=100000 # rows read at a time with "--stream" for sites too long to hold in memory
 
 numperday=24 # standard samples per day
 numperdayDMF=12    # had to use this in the DMF case since they typically only record every two hours
 minnumperday=18    # minimum number of observations to generate daily average (since most have numperday =24)
 minnumperdayDMF=10 # had to use this in DMF case since they typically only record every two hours
 mindayspermonth=25  # we use this criteria according to NERACOOS convention
+sampling={'DMF':(numperdayDMF,minnumperdayDMF),'MA1':(numperdayDMF,minnumperdayDMF)} # site prefixes of the non-standard cases
 minsamperyear=8000  # we use this criteria as "12" when feeding to NARR BAY group WHAQ and NARR data since we only had monthly data in some years
+qc_limits={'tmin':28.4,'tmax':86.,'spike':5.4,'maxrate':3.6,'window':25,'mindepth':1.,'depthfrac':0.5} # with "--qc" (degF, degF/hour, samples, m, see "emolt_qc.py")
+depthgap=10.        # with "--split-depths", instrument depths more than this many meters apart get their own products
+minclusterpts=720   # but only if they have at least this many samples (a month of hourly data)
 ###################################################################################################################################
 
-### IMPORT MODULES
-from pandas import Series
-import matplotlib.pyplot as plt
-from matplotlib.dates import DateFormatter
+### IMPORT MODULES (matplotlib is only imported once there is something to plot)
 import numpy as np
-from pandas import read_csv,DataFrame
-from dateutil.parser import parse
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor,ProcessPoolExecutor,wait,FIRST_COMPLETED
+from functools import partial
 import warnings
+from emolt_erddap import getobs_latlon_cached,getobs_chunks,NoData
+from emolt_agg import aggregate_frames,period_frames,update_frames,read_state,write_state,DailyStats
+from emolt_sites import load_sites
+from emolt_plots import draw_site,use_batch_backend
+from emolt_output import write_products,have_parquet
+from emolt_timing import stage,collect,setup,settings,records,write_report
+from emolt_qc import qc_site
 warnings.filterwarnings("ignore")
 
 # We onced had a function to read eMOLT data given 4-digit site code and time wanted (obsolete in 2023 when "site" was removed from ERDDAP)
 # Now, we get site's lat/lon from a lookup table and then access ERDDAP
 
 def getsite_latlon(site):
-    # get lat/lon ofr given 4-digit eMOLT site
-    df=read_csv(site_lookup)
-    df1=df[df['SITE']==site]
-    return df1['LAT_DDMM'].values[0],df1['LON_DDMM'].values[0]
+    # get lat/lon ofr given 4-digit eMOLT site (the lookup table is only read once, see "emolt_sites.py")
+    return load_sites(site_lookup,cachedir,sampling).latlon(site)
 
 def getobs_tempdepth_latlon(lat,lon):
     """
     Function written by Jim Manning to get emolt data from url, return datetime, depth, and temperature.
     this version needed in early 2023 when "site" was no longer served via ERDDAP
+    Modified Oct 2026 to only download what is new since the last run and parse the times in one vectorized pass (see "emolt_erddap.py")
     """
-    url = 'https://comet.nefsc.noaa.gov/erddap/tabledap/eMOLT.csvp?time,depth,sea_water_temperature&latitude='+str(lat)+'&longitude='+str(lon)+'+&orderBy(%22time%22)'
-    df=read_csv(url,skiprows=[1])
-    df['time']=df['time (UTC)']
-    temp=1.8 * df['sea_water_temperature (degree_C)'].values + 32 #converts to degF
-    depth=df['depth (m)'].values
-    time=[];
-    for k in range(len(df)):
-            time.append(parse(df.time[k]))
+    dfnew=getobs_latlon_cached(lat,lon,cachedir) # temp in degF and Depth indexed by time
     print('using erddap')            
-    dfnew=DataFrame({'temp':temp,'Depth':depth},index=time)
     return dfnew
 
-### MAIN PROGRAM LOOP THROUGH SITES
-for k in range(len(site)):
-    # get data from ERDDAP using a function in the "getdata_eric" module of functions
-    if (site[k][0:3]=='DMF') or (site[k][0:3]=='MA1'): #non-standard case 
-        minnumperday=minnumperdayDMF# had to use this in DMF case since they typically only record every two hours
-        numperday=numperdayDMF
-    print('getting data for '+site[k]+' on NEFSC ERDDAP server')
-    [lat,lon]=getsite_latlon(site[k])# started using this on 25 May 2023 when NEFSC took away "site" from ERDDAP
-    df=getobs_tempdepth_latlon(lat,lon)
-    #[datet,temp,depth_i]=getobs_temp(site[k],input_time=[dt.datetime(1880,1,1,0,0,0,0,pytz.UTC),dt.datetime(2020,1,1,0,0,0,0,pytz.UTC)])
-    depth=int(np.mean(df.Depth))# mean depth of instrument to be added to outputfilename (NOTE: WE MAY NEED TO CHANGE THIS FOR SITES WITH MORE THAN JUST BOTTOM RECORDS.)
+def getsite_numperday(site,thresholds=None):
+    # returns the samples per day expected and the minimum needed for a daily average at this site
+    # where the DMF cases typically only record every two hours (see "sampling" above)
+    # and "thresholds" can replace the standard "numperday" and "minnumperday" above
+    th={'numperday':numperday,'minnumperday':minnumperday}
+    th.update(thresholds or {})
+    return load_sites(site_lookup,cachedir,sampling).numperday(site,(th['numperday'],th['minnumperday']))
+
+def getobs_site(site,stream=False):
+    # get data from ERDDAP for a 4-digit eMOLT site
+    # where stream=True reads it in chunks and returns just the running daily stats (see "DailyStats" in "emolt_agg.py")
+    print('getting data for '+site+' on NEFSC ERDDAP server')
+    with stage(site,'fetch') as t: # timed when "--report" is given (see "emolt_timing.py")
+        [lat,lon]=getsite_latlon(site)# started using this on 25 May 2023 when NEFSC took away "site" from ERDDAP
+        if not stream:
+            df=getobs_tempdepth_latlon(lat,lon)
+            n=len(df)
+        else:
+            df=DailyStats()
+            n=0
+            for [time,depth,temp] in getobs_chunks(lat,lon,chunksize):
+                df.add(time,temp,depth)
+                n+=len(time)
+            df.finish()
+        t.rows=n # only for the report (without "--report" every thread shares the same do-nothing timer)
+    if n==0: # reported as such rather than as whatever the averaging would trip on (ERDDAP errors raise FetchError)
+        raise NoData('no data on ERDDAP for '+site)
+    return df
+
+def getsite_frames(site,datet,temp,full=False,key=''):
+    """
+    returns the daily, monthly, and annual stats of a site's observations
+    redoing only the last year of the previous run on (see "update_frames" in "emolt_agg.py") unless full=True
+    where the stats are kept in "cachedir" for the next run (with "key" added to the file name for each set of products)
+    """
+    fn=cachedir+site+key+'_clim.pkl'
+    state=None if full else read_state(fn,datet,temp)
+    if state is None:
+        frames=period_frames(datet,temp)
+    elif state[0]==len(datet): # nothing new since the last run
+        frames=state[1]
+    else:
+        print(site+key+': '+str(len(datet)-state[0])+' new observations folded in')
+        frames=update_frames(state[1],datet,temp)
+    if state is None or state[0]<len(datet):
+        write_state(fn,datet,temp,frames)
+    return {k:frames[k].copy() for k in frames} # the csv formatting below changes them
+
+def clim_site(site,df,plot=None,full=False,outputs=(),qc=False,split=False,thresholds=None):
+    """
+    makes the daily, monthly, annual, and climatology csv files and the plots for one site
+    where "df" is what "getobs_site" returns (the observations or, when streamed, the running daily stats)
+    and "plot" is "plot_site", "plot_site_batch", or None for no plots
+    and full=True recomputes the stats from the whole record instead of updating those of the last run
+    and "outputs" are the extra formats wanted besides the csv files ('npz', 'parquet', and 'html', see "emolt_output.py")
+    and qc=True drops the samples failing the checks of "emolt_qc.py" (with the "qc_limits" above) before averaging
+    and split=True makes a set of products for each instrument depth (more than "depthgap" apart) instead of one for the site
+    and "thresholds" can replace any of "numperday", "minnumperday", and "mindayspermonth" above, e.g., {'mindayspermonth':20}
+    returns a list of what "plot" returns for each set of products
+    """
+    [numperday,minnumperday]=getsite_numperday(site,thresholds)
+    mindays=(thresholds or {}).get('mindayspermonth',mindayspermonth)
+    #[datet,temp,depth_i]=getobs_temp(site,input_time=[dt.datetime(1880,1,1,0,0,0,0,pytz.UTC),dt.datetime(2020,1,1,0,0,0,0,pytz.UTC)])
+    if isinstance(df,DailyStats): # streamed, so there are only the daily stats to go on (no qc or depth split, see "run")
+        t=stage(site,'stats').start()
+        depth=int(df.depth())
+        [tso,bad]=df.aggregate(minnumperday,mindays*numperday,site)
+        t.done(len(tso['da']))
+        return [write_site(site,depth,tso,bad,plot,outputs)]
     temp=df.temp.values
     datet=df.index.values
-    tso=Series(temp,index=datet)
+    if not (qc or split):
+        t=stage(site,'stats').start()
+        depth=int(np.mean(df.Depth))# mean depth of instrument to be added to outputfilename (NOTE: WE MAY NEED TO CHANGE THIS FOR SITES WITH MORE THAN JUST BOTTOM RECORDS.)
+        # all five sets of stats (see "emolt_agg.py") where "bad" flags the rows without enough samples
+        [tso,bad]=aggregate_frames(getsite_frames(site,datet,temp,full),minnumperday,mindays*numperday,site)
+        t.done(len(tso['da']))
+        return [write_site(site,depth,tso,bad,plot,outputs)]
+    with stage(site,'qc') as t:
+        sets=qc_site(datet,temp,df.Depth.values,qc_limits if qc else None,split,depthgap,minclusterpts)
+        t.rows=len(datet)
+    sets=[keep for keep in sets if keep.any()]
+    if not sets: # reported as a failed site by "clim_sites" rather than passing without output
+        why='no depth cluster with at least '+str(minclusterpts)+' samples' if split else 'no samples'
+        raise NoData(site+': '+why+(' that pass the quality control' if qc else ''))
+    drawn=[]
+    for keep in sets:
+        depth=int(np.nanmean(df.Depth.values[keep]))# mean depth of this instrument
+        key=('_qc' if qc else '')+('_'+str(depth)+'m' if split else '')
+        print(site+key+': '+str(np.sum(keep))+' of '+str(len(keep))+' samples used')
+        t=stage(site,'stats').start()
+        [tso,bad]=aggregate_frames(getsite_frames(site,datet[keep],temp[keep],full,key),minnumperday,mindays*numperday,site)
+        t.done(len(tso['da']))
+        drawn.append(write_site(site,depth,tso,bad,plot,outputs,site+'_'+str(depth)+'m' if split else site))
+    return drawn
 
+def write_site(site,depth,tso,bad,plot=None,outputs=(),label=None):
+    """
+    writes the csv files (and any other "outputs") of one set of products and makes its plots
+    given the stats "tso" and masks "bad" of "aggregate_frames" and the depth in the file names
+    where "label" names the plots (the site unless it has more than one depth)
+    """
+    t=stage(site,'csv').start()
     #create a daily mean
     #tsod=tso.resample('D',how=['count','mean','median','min','max','std'],loffset=timedelta(hours=-12)) #old method to create daily averages
-    tsod=tso.resample('D').agg({'count':np.size, 'mean':np.mean,'median':np.median,'min':np.min,'max':np.max,'std':np.std})
+    tsod=tso['da']
     #tsod.ix[tsod['count']<minnumperday,['mean','median','min','max','std']] = 'NaN' # set daily averages to not-a-number if not enough went into it
-    tsod.loc[tsod['count']<minnumperday,['mean','median','min','max','std']] = 'NaN' # set daily averages to not-a-number if not enough went into it
+    tsod.loc[bad['da'],['mean','median','min','max','std']] = 'NaN' # set daily averages to not-a-number if not enough went into it
     #add columns for custom date format
     tsod['yy']=tsod.index.year
     tsod['mm']=tsod.index.month
@@ -101,11 +192,11 @@ for k in range(len(site)):
     tsod['std']=tsod['std'].astype(float)   # makes for cleaner format on output to csv
     output_fmt=['yy','mm','dd','count','mean','median','min','max','std']
     tsodp=tsod.reindex(columns=output_fmt)  
-    tsodp.to_csv(outdir+site[k]+'_wtmp_da_'+str(depth)+'.csv',index=False,header=False,na_rep='NaN',float_format='%10.2f')
+    tsodp.to_csv(outdir+site+'_wtmp_da_'+str(depth)+'.csv',index=False,header=False,na_rep='NaN',float_format='%10.2f')
 
     #create a monthly mean
-    tsom=tso.resample('m',kind='period').agg({'count':np.size, 'mean':np.mean,'median':np.median,'min':np.min,'max':np.max,'std':np.std})
-    tsom.loc[tsom['count']<mindayspermonth*numperday,['mean','median','min','max','std']] = 'NaN'
+    tsom=tso['ma']
+    tsom.loc[bad['ma'],['mean','median','min','max','std']] = 'NaN'
     #add columns for custom date format
     tsom['yy']=tsom.index.year
     tsom['mm']=tsom.index.month
@@ -114,20 +205,11 @@ for k in range(len(site)):
     tsom['std']=tsom['std'].astype(float)   # makes for cleaner format on output to csv
     output_fmt=['yy','mm','dd','count','mean','median','min','max','std']
     tsomp=tsom.reindex(columns=output_fmt)# found I needed to generate a new dataframe to print in this order
-    tsomp.to_csv(outdir+site[k]+'_wtmp_ma_'+str(depth)+'.csv',index=False,header=False,na_rep='NaN',float_format='%10.2f')
+    tsomp.to_csv(outdir+site+'_wtmp_ma_'+str(depth)+'.csv',index=False,header=False,na_rep='NaN',float_format='%10.2f')
 
     #create a Annual mean
-    tsoy=tso.resample('A',kind='period').agg({'count':np.size, 'mean':np.nanmean,'median':np.median,'min':np.min,'max':np.max,'std':np.std})
-    if site[k]=='NARR': # special case for this site since sample frequency changed
-      tsoy.loc[(tsoy['count']<350)&(tsoy.index.year<2001),['mean','median','min','max','std']] = 'NaN'
-      tsoy.loc[(tsoy['count']<8000)&(tsoy.index.year>=2001),['mean','median','min','max','std']] = 'NaN'
-    elif site[k]=='WHAQ': # special case for this site since sample frequency changed
-      tsoy.loc[(tsoy['count']<12)&(tsoy.index.year<1962),['mean','median','min','max','std']] = 'NaN'  #monthly samples
-      tsoy.loc[(tsoy['count']<350)&(tsoy.index.year>=1962),['mean','median','min','max','std']] = 'NaN'#daily
-      tsoy.loc[(tsoy['count']<8000)&(tsoy.index.year>=2001),['mean','median','min','max','std']] = 'NaN'#hourly
-    else:
-      minsamperyear=0.8*np.max(tsoy['count'])# 80% of the maximum #per year
-      tsoy.loc[tsoy['count']<minsamperyear,['mean','median','min','max','std']] = 'NaN' # if # months are not covered, set that year to NaN
+    tsoy=tso['ya']
+    tsoy.loc[bad['ya'],['mean','median','min','max','std']] = 'NaN' # if # months are not covered, set that year to NaN (80% of the max #per year except at NARR and WHAQ)
     #add columns for custom date format
     tsoy['yy']=tsoy.index.year
     tsoy['mm']=12
@@ -136,16 +218,10 @@ for k in range(len(site)):
     tsoy['std']=tsoy['std'].astype(float)   # makes for cleaner format on output to csv
     output_fmt=['yy','mm','dd','count','mean','median','min','max','std']
     tsoyp=tsoy.reindex(columns=output_fmt)# found I needed to generate a new dataframe to print in this order
-    tsoyp.to_csv(outdir+site[k]+'_wtmp_ya_'+str(depth)+'.csv',index=False,header=False,na_rep='NaN',float_format='%10.2f')
+    tsoyp.to_csv(outdir+site+'_wtmp_ya_'+str(depth)+'.csv',index=False,header=False,na_rep='NaN',float_format='%10.2f')
  
-    #create daily climatolgies using daily means
-    newindex=[]
-    for j in range(len(tsod)):    
-        newindex.append(tsod['mean'].index[j].replace(year=2000,tzinfo=None)) # puts all observations in the same year, 2000
-        # Note: I added this tzinfo=None in Aug 2014 because of a bug in Pandas 
-    tsodnew=Series(tsod['mean'].values,index=newindex).sort_index()
-    # trouble with this section in March 2016 since there is was apparently some "non numeric" values so I added the previous line
-    tsdc=tsodnew.resample('D').agg({'count':np.size, 'mean':np.mean,'median':np.median,'min':np.min,'max':np.max,'std':np.std})    #add columns for custom date format
+    #create daily climatolgies using daily means (all put in the same year, 2000)
+    tsdc=tso['dc']    #add columns for custom date format
     tsdc['yy']=0
     tsdc['mm']=tsdc.index.month
     tsdc['dd']=tsdc.index.day
@@ -153,16 +229,10 @@ for k in range(len(site)):
     tsdc['std']=tsdc['std'].astype(float)   # makes for cleaner format on output to cs    
     output_fmt=['yy','mm','dd','count','mean','median','min','max','std']
     tsdcp=tsdc.reindex(columns=output_fmt)# found I needed to generate a new dataframe to print in this order
-    tsdcp.to_csv(outdir+site[k]+'_wtmp_dc_'+str(depth)+'.csv',index=False,header=False,na_rep='NaN',float_format='%10.2f')
-
-    #create monthly climatologies using monthly means
-    newindex=[]
-    for j in range(len(tsom)):    
-        newindex.append(tsom['mean'].index[j].to_timestamp().replace(year=2000,tzinfo=None)) # puts all observations in the same year, 2000
-        # Note: I added this tzinfo=None in Aug 2014 because of a bug in Pandas 
-    tsomnew=Series(tsom['mean'].values,index=newindex).sort_index()
-    # trouble with this section in March 2016 since there is was apparently some "non numeric" values so I added the previous line
-    tsmc=tsomnew.resample('M').agg({'count':np.size, 'mean':np.mean,'median':np.median,'min':np.min,'max':np.max,'std':np.std})    #add columns for custom date format
+    tsdcp.to_csv(outdir+site+'_wtmp_dc_'+str(depth)+'.csv',index=False,header=False,na_rep='NaN',float_format='%10.2f')
+
+    #create monthly climatologies using monthly means (all put in the same year, 2000)
+    tsmc=tso['mc']    #add columns for custom date format
     tsmc['yy']=0
     tsmc['mm']=tsmc.index.month
     tsmc['dd']=tsmc.index.day
@@ -170,7 +240,8 @@ for k in range(len(site)):
     tsmc['std']=tsmc['std'].astype(float)   # makes for cleaner format on output to cs    
     output_fmt=['yy','mm','dd','count','mean','median','min','max','std']
     tsmcp=tsmc.reindex(columns=output_fmt)# found I needed to generate a new dataframe to print in this order
-    tsmcp.to_csv(outdir+site[k]+'_wtmp_mc_'+str(depth)+'.csv',index=False,header=False,na_rep='NaN',float_format='%10.2f')
+    tsmcp.to_csv(outdir+site+'_wtmp_mc_'+str(depth)+'.csv',index=False,header=False,na_rep='NaN',float_format='%10.2f')
+    t.done(len(tsodp)+len(tsomp)+len(tsoyp)+len(tsdcp)+len(tsmcp))
 
     '''
     tsmccount=tsdc['count'].resample('m').agg({'count':np.size, 'mean':np.mean,'median':np.median,'min':np.min,'max':np.max,'std':np.std})
@@ -200,32 +271,166 @@ for k in range(len(site)):
     output_fmt=['yy','mm','dd','count','mean','median','min','max','std']
     
     tsmcpcount=tsmccount.reindex(columns=output_fmt)# found I needed to generate a new dataframe to print in this order
-    tsmcpcount.to_csv(outdir+site[k]+'_wtmp_mc_'+str(int(depth))+'.csv',index=False,header=False,na_rep='NaN',float_format='%10.2f')
+    tsmcpcount.to_csv(outdir+site+'_wtmp_mc_'+str(int(depth))+'.csv',index=False,header=False,na_rep='NaN',float_format='%10.2f')
     '''
-    output_fmt_html=['mm','count','mean','median','min','max','std']
-    outhtml=tsmcp.to_html(header=True,index=False,na_rep='NaN',float_format=lambda x: '%10.2f' % x,columns=output_fmt_html)
+    formats=[f for f in outputs if f in ['npz','parquet']]
+    if formats: # typed columnar copies of the five products
+        with stage(site,'output'):
+            write_products(outdir,site,depth,{'da':tsodp,'ma':tsomp,'ya':tsoyp,'dc':tsdcp,'mc':tsmcp},formats)
+    if 'html' in outputs: # only formatted when asked for
+        with stage(site,'html'):
+            output_fmt_html=['mm','count','mean','median','min','max','std']
+            outhtml=tsmcp.to_html(header=True,index=False,na_rep='NaN',float_format=lambda x: '%10.2f' % x,columns=output_fmt_html)
+            with open(outdir+site+'_wtmp_mc_'+str(depth)+'.html','w') as f:
+                f.write(outhtml)
     
     #make three plots: 1- daily means, 2- annual, and 3- seasonal cycle
+    if plot is not None:
+        with stage(site,'plot'): # just the hand-off when the plots are drawn in other processes
+            return plot(label or site,tsod['mean'].astype(float),tsoy['mean'].dropna().astype(float),tsmc['mean'].astype(float))
 
+def plot_site(site,daily,annual,mclim):
+    # the three plots on new figures, each shown and saved, given the daily means, annual means, and monthly climatology
+    import matplotlib.pyplot as plt
+    from matplotlib.dates import DateFormatter
     plt.figure() # daily mean
-    tsod['mean'].astype(float).plot() #plot daily mean after getting rid of non-nmeric values
-    plt.title(site[k]+' daily means')
+    daily.plot() #plot daily mean after getting rid of non-nmeric values
+    plt.title(site+' daily means')
     plt.show()
-    plt.savefig(pltdir+site[k]+'_jt.png')
+    plt.savefig(pltdir+site+'_jt.png')
     
     plt.figure() # annual mean
-    tsoy['mean'].dropna().astype(float).plot(marker='.',linewidth=2,markersize=20) #plot annual mean after getting rid of non-nmeric values
-    plt.title(site[k]+' annual means')
+    annual.plot(marker='.',linewidth=2,markersize=20) #plot annual mean after getting rid of non-nmeric values
+    plt.title(site+' annual means')
     #thismanager = plt.get_current_fig_manager()
     #thismanager.window.setGeometry(50,100,640, 545)
     plt.show()
-    plt.savefig(pltdir+site[k]+'_annual_clim.png')
+    plt.savefig(pltdir+site+'_annual_clim.png')
     
     plt.figure() # seasonal cycle
-    tt=tsmc['mean'].astype(float).plot() #plot mthly clim
+    tt=mclim.plot() #plot mthly clim
     tt.xaxis.set_major_formatter(DateFormatter('%b'))
-    plt.title(site[k]+' Monthly Climatology')
+    plt.title(site+' Monthly Climatology')
     plt.show()
-    plt.savefig(pltdir+site[k]+'_seacycle.png')
+    plt.savefig(pltdir+site+'_seacycle.png')
     plt.close('all')
-  
+
+def plot_site_batch(site,daily,annual,mclim):
+    # the same three plots drawn on figures reused from site to site without showing them (see "emolt_plots.py")
+    draw_site(site,daily,annual,mclim,pltdir)
+
+def clim_sites(sites,workers=1,stream=False,plots='show',plotworkers=0,full=False,outputs=(),qc=False,split=False,thresholds=None):
+    """
+    runs "clim_site" for each site, returning a dictionary of the sites that failed and why
+    with workers>1, up to that many sites are downloaded at once in threads while
+    the averaging and plotting is done in a pool of processes (with no more than 2*workers sites in hand at a time)
+    with stream=True, each site is read in chunks into running daily stats to bound the memory used
+    where plots is 'show' (the original way), 'batch' (reused figures with no screen), or 'none'
+    and plotworkers>0 draws the plots in that many other processes while the next sites are computed
+    and full=True ignores the stats kept from the last run (see "getsite_frames")
+    and "outputs", "qc", "split", and "thresholds" are passed on to "clim_site"
+    """
+    load_sites(site_lookup,cachedir,sampling) # the site table is read before the fetch threads and processes below need it
+    plot={'show':plot_site,'batch':plot_site_batch,'none':None}[plots]
+    if plot is not None and (workers>1 or plotworkers>0):
+        plot=plot_site_batch # the plots are made in other processes where there is nothing to show them on
+    if plot is plot_site_batch:
+        use_batch_backend()
+    failed={}
+    if workers<=1:
+        plotters=ProcessPoolExecutor(plotworkers) if (plot is not None and plotworkers>0) else None
+        drawn={}
+        for site in sites:
+            try:
+                if plotters is None:
+                    clim_site(site,getobs_site(site,stream),plot,full,outputs,qc,split,thresholds)
+                else:
+                    drawn[site]=clim_site(site,getobs_site(site,stream),partial(plotters.submit,plot),full,outputs,qc,split,thresholds)
+            except Exception as e: # one bad site should not stop the others
+                failed[site]=e
+                print(site+' failed: '+repr(e))
+        for site in drawn:
+            try:
+                for future in drawn[site]:
+                    future.result()
+            except Exception as e:
+                failed[site]=e
+                print(site+' plots failed: '+repr(e))
+        if plotters is not None:
+            plotters.shutdown()
+        return failed
+    window=2*workers # sites downloaded or waiting to be averaged at any one time, so memory does not grow with the number of sites
+    with ThreadPoolExecutor(workers) as fetchers,ProcessPoolExecutor(workers) as crunchers:
+        todo=iter(sites)
+        fetched={}
+        crunched={}
+        def fetch_next():
+            for site in todo:
+                fetched[fetchers.submit(getobs_site,site,stream)]=site
+                return
+        for k in range(window):
+            fetch_next()
+        while fetched:
+            done,_=wait(fetched,return_when=FIRST_COMPLETED) # start on each site as soon as its data arrives
+            for f in done:
+                site=fetched.pop(f) # so its data is only held by the job below
+                try:
+                    crunched[site]=crunchers.submit(collect,dict(settings),clim_site,site,f.result(),plot,full,outputs,qc,split,thresholds) # brings back its timings too
+                except Exception as e:
+                    failed[site]=e
+                busy=[c for c in crunched.values() if not c.done()]
+                while busy and len(fetched)+len(busy)>=window:
+                    wait(busy,return_when=FIRST_COMPLETED)
+                    busy=[c for c in busy if not c.done()]
+                fetch_next()
+            del done,f
+        for site in sites: # report in the order of the site list
+            try:
+                if site in crunched:
+                    records.extend(crunched[site].result()[1])
+            except Exception as e:
+                failed[site]=e
+            if site in failed:
+                print(site+' failed: '+repr(failed[site]))
+    return failed
+
+def add_arguments(parser):
+    # the options of this script (also the "climatology" command of "emolt_cli.py")
+    parser.add_argument('sites',nargs='*',default=site,help='4-digit eMOLT site codes (the "site" list above if none)')
+    parser.add_argument('--numperday',type=int,default=numperday,help='standard samples per day')
+    parser.add_argument('--minnumperday',type=int,default=minnumperday,help='minimum samples for a daily average')
+    parser.add_argument('--mindayspermonth',type=int,default=mindayspermonth,help='minimum days of samples for a monthly average')
+    parser.add_argument('--workers',type=int,default=1,help='number of sites to download and process at the same time')
+    parser.add_argument('--stream',action='store_true',help='read each site in chunks into daily stats instead of all at once (for very long or sub-hourly records)')
+    parser.add_argument('--batch',action='store_true',help='draw the plots without a screen on figures reused from site to site')
+    parser.add_argument('--plot-workers',type=int,default=0,help='number of processes drawing plots while the next sites are computed (implies --batch)')
+    parser.add_argument('--no-plots',action='store_true',help='only make the csv files')
+    parser.add_argument('--full',action='store_true',help='recompute the stats from the whole record instead of updating those kept from the last run')
+    parser.add_argument('--output',action='append',default=[],choices=['npz','parquet','html'],help='also write the products in this format (repeat for more than one)')
+    parser.add_argument('--qc',action='store_true',help='drop out-of-water, out-of-range, spike, and sudden-jump samples before averaging (see "qc_limits")')
+    parser.add_argument('--split-depths',action='store_true',help='make separate products for each instrument depth at a site')
+    parser.add_argument('--report',help='time each stage of each site and save the timings to this json or csv file')
+    parser.add_argument('--profile',metavar='SITE',help='also run cProfile on this site (SITE_STAGE.prof files next to the report)')
+
+def run(args,parser):
+    # runs "clim_sites" with the options of "add_arguments", returning the sites that failed
+    if 'parquet' in args.output and not have_parquet():
+        parser.error('--output parquet needs pyarrow or fastparquet installed (or use --output npz)')
+    if args.stream and (args.qc or args.split_depths):
+        parser.error('--qc and --split-depths need each sample, so they cannot be used with --stream (which keeps only daily sums)')
+    plots='none' if args.no_plots else 'batch' if args.batch else 'show'
+    if args.report or args.profile:
+        setup(True,args.profile,os.path.dirname(args.report or '') or '.')
+    thresholds={'numperday':args.numperday,'minnumperday':args.minnumperday,'mindayspermonth':args.mindayspermonth}
+    failed=clim_sites(args.sites,args.workers,args.stream,plots,args.plot_workers,args.full,args.output,args.qc,args.split_depths,thresholds)
+    if args.report:
+        write_report(args.report)
+    if failed:
+        print('no output for '+','.join(failed))
+    return failed
+
+### MAIN PROGRAM LOOP THROUGH SITES
+if __name__=='__main__':
+    parser=argparse.ArgumentParser(description='generate the NERACOOS climatology csv files and plots for eMOLT sites')
+    add_arguments(parser)
+    run(parser.parse_args(),parser)
@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+"""
+Daily, monthly, annual, daily climatology and monthly climatology statistics for "clim.py"
+computed in one pass over the sorted time series with numpy group codes
+
+This replaces the five "resample(...).agg({'count':np.size,'mean':np.mean,...})" calls and gives the same numbers:
+count includes NaN (like np.size), std uses ddof=1 (like pandas), and a group without data gives NaN
+
+"DailyStats" does the same from running daily sums for records streamed in chunks (see "clim.py --stream")
+"update_frames" brings the daily, monthly, and annual stats saved by the last run up to date by redoing only its last year on
+"""
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+
+stats=['count','mean','median','min','max','std']
+
+def running_stats(v,first,n):
+    """
+    mean and std (ddof=1) of the groups of "v" starting at "first" with "n" values each
+    accumulated value by value in the same order and with the same formulas as pandas' groupby
+    (Kahan-compensated sum for the mean, Welford for the variance) so the results round the same way;
+    the loop is over the position within a group, so each step is vectorized across all groups
+    """
+    sumx=np.zeros(len(n)); comp=np.zeros(len(n))
+    mean=np.zeros(len(n)); m2=np.zeros(len(n))
+    order=np.argsort(-n,kind='stable') # longest groups first so the groups still going are always a leading slice
+    first,nsorted=first[order],n[order]
+    for p in range(nsorted[0] if len(n) else 0):
+        g=np.searchsorted(-nsorted,-p,side='left') # number of groups with more than p values
+        val=v[first[:g]+p]
+        y=val-comp[:g]
+        t=sumx[:g]+y
+        comp[:g]=t-sumx[:g]-y
+        comp[:g][np.isnan(comp[:g])]=0
+        sumx[:g]=t
+        old=mean[:g].copy()
+        mean[:g]=old+(val-old)/(p+1)
+        m2[:g]+=(val-mean[:g])*(val-old)
+    out_mean=np.empty(len(n)); out_std=np.full(len(n),np.nan)
+    out_mean[order]=sumx/nsorted
+    more=nsorted>1
+    out_std[order[more]]=np.sqrt(m2[more]/(nsorted[more]-1))
+    return out_mean,out_std
+
+def near_half(x):
+    # values so close to a rounding tie of the '%10.2f' output format that the last bits decide it
+    f=np.abs(x)*100
+    return np.abs(f-np.floor(f)-0.5)<1e-6
+
+def small_int(codes,ngroups):
+    # int16 codes let numpy use a radix sort for the stable sort by group
+    return codes.astype(np.int16) if ngroups<2**15 else codes
+
+def group_stats(codes,values,ngroups,byvalue=None):
+    """
+    count, mean, median, min, max, and std of "values" for groups 0..ngroups-1 given by integer "codes"
+    where "byvalue" can be np.argsort(values) when it is already known
+    returns a dictionary of arrays of length ngroups
+    """
+    count=np.bincount(codes,minlength=ngroups)
+    ok=~np.isnan(values)
+    c,v=codes[ok],values[ok]
+    if np.any(c[1:]<c[:-1]): # the climatologies are not in group order
+        bytime=np.argsort(c,kind='stable') # keeps the time order within each group
+        c,v=c[bytime],v[bytime]
+    n=np.bincount(c,minlength=ngroups)
+    start=np.cumsum(n)-n
+    has=n>0
+    out={'count':count}
+    for k in stats[1:]:
+        out[k]=np.full(ngroups,np.nan)
+    if not has.any():
+        return out
+    first,nh=start[has],n[has]
+    mean=np.add.reduceat(v,first)/nh
+    dev=v-np.repeat(mean,nh)
+    std=np.full(len(nh),np.nan)
+    more=nh>1
+    std[more]=np.sqrt(np.add.reduceat(dev*dev,first)[more]/(nh[more]-1))
+    redo=near_half(mean)|near_half(std) # only these few need pandas' exact order of operations to print the same
+    if redo.any():
+        mean[redo],std[redo]=running_stats(v,first[redo],nh[redo])
+    out['mean'][has],out['std'][has]=mean,std
+    if byvalue is None:
+        byvalue=np.argsort(values) # NaN go last
+    order=byvalue[np.argsort(small_int(codes,ngroups)[byvalue],kind='stable')] # by group and then by value within each group
+    vs=values[order[ok[order]]]
+    out['median'][has]=(vs[first+(nh-1)//2]+vs[first+nh//2])/2
+    out['min'][has]=vs[first]
+    out['max'][has]=vs[first+nh-1]
+    return out
+
+def stats_frame(out,index):
+    return pd.DataFrame({k:out[k] for k in stats},index=index)
+
+def annual_mask(count,year,site=''):
+    # years without enough samples to report an annual mean
+    if site=='NARR': # special case for this site since sample frequency changed
+        return ((count<350)&(year<2001))|((count<8000)&(year>=2001))
+    elif site=='WHAQ': # special case for this site since sample frequency changed
+        return ((count<12)&(year<1962))|((count<350)&(year>=1962))|((count<8000)&(year>=2001)) # monthly, daily, hourly samples
+    return count<0.8*np.max(count) # 80% of the maximum #per year
+
+def month_of(days):
+    # month (1-12) and day of month of datetime64[D] values
+    months=days.astype('datetime64[M]')
+    return (months-days.astype('datetime64[Y]')).astype(int)+1,(days-months).astype(int)+1
+
+def time_order(time,temp):
+    time=np.asarray(time)
+    temp=np.asarray(temp,dtype=float)
+    if np.any(time[1:]<time[:-1]):
+        order=np.argsort(time,kind='stable')
+        time,temp=time[order],temp[order]
+    return time,temp
+
+def period_frames(time,temp):
+    """
+    returns a dictionary of the daily ('da'), monthly ('ma'), and annual ('ya') dataframes
+    of count, mean, median, min, max, and std indexed the way pandas resample would index them
+    where "time" is datetime64 (UTC)
+    """
+    time,temp=time_order(time,temp)
+    byvalue=np.argsort(temp) # sorted once for the medians of all three
+    frames={}
+    days=time.astype('datetime64[D]')
+    code=(days-days[0]).astype(int)
+    frames['da']=stats_frame(group_stats(code,temp,code[-1]+1,byvalue),pd.date_range(days[0],periods=code[-1]+1,freq='D'))
+    months=time.astype('datetime64[M]')
+    code=(months-months[0]).astype(int)
+    frames['ma']=stats_frame(group_stats(code,temp,code[-1]+1,byvalue),pd.period_range(str(months[0]),periods=code[-1]+1,freq='M'))
+    years=time.astype('datetime64[Y]')
+    code=(years-years[0]).astype(int)
+    frames['ya']=stats_frame(group_stats(code,temp,code[-1]+1,byvalue),pd.period_range(str(years[0]),periods=code[-1]+1,freq='Y'))
+    return frames
+
+def aggregate_frames(frames,minnumperday,minnumpermonth,site=''):
+    """
+    adds the masks and climatologies to the 'da','ma','ya' frames, returning two dictionaries keyed by 'da','ma','ya','dc','mc':
+    1- dataframes of count, mean, median, min, max, and std
+    2- boolean masks of the daily, monthly, and annual rows without enough samples (the climatologies have none)
+    where "minnumpermonth" is the number of samples needed in a month
+    The climatologies are made from the daily and monthly means after the masked rows are set to NaN.
+    """
+    masks={}
+    masks['da']=frames['da']['count'].values<minnumperday
+    masks['ma']=frames['ma']['count'].values<minnumpermonth
+    masks['ya']=annual_mask(frames['ya']['count'].values,frames['ya'].index.year.values,site)
+    climatologies(frames,masks)
+    return frames,masks
+
+def aggregate(time,temp,minnumperday,minnumpermonth,site=''):
+    # all five sets of stats and the masks (see "aggregate_frames") of the observations "temp" at "time"
+    return aggregate_frames(period_frames(time,temp),minnumperday,minnumpermonth,site)
+
+def splice(old,new):
+    # the rows of "old" before "new" starts followed by "new" (and empty rows in any gap between them) as if made all at once
+    df=pd.concat([old[old.index<new.index[0]],new])
+    if isinstance(new.index,pd.PeriodIndex):
+        index=pd.period_range(df.index[0],df.index[-1],freq=new.index.freq)
+    else:
+        index=pd.date_range(df.index[0],df.index[-1],freq='D')
+    df=df.reindex(index)
+    df['count']=df['count'].fillna(0).astype(np.int64)
+    return df
+
+def update_frames(frames,time,temp):
+    """
+    the "period_frames" of the whole record given "frames" made from an earlier part of it
+    where only the year of the last day in "frames" and after are redone (from the observations since that year began)
+    so each run costs about a year of data however long the record is and gives the same numbers as doing it all
+    """
+    time,temp=time_order(time,temp)
+    cut=np.datetime64(str(frames['da'].index[-1].year),'Y')
+    i=np.searchsorted(time,cut.astype(time.dtype))
+    if i==len(time):
+        return frames
+    new=period_frames(time[i:],temp[i:])
+    return {k:splice(frames[k],new[k]) for k in new}
+
+def fingerprint(time,temp):
+    # identifies the observations (times and values) the frames were made from
+    h=hashlib.sha1(np.ascontiguousarray(time).astype('datetime64[s]').tobytes())
+    h.update(np.ascontiguousarray(temp,dtype=float).tobytes())
+    return h.hexdigest()
+
+def read_state(fn,time,temp):
+    """
+    returns the number of observations and the frames saved by "write_state"
+    or None if there is no such file or its observations are not the start of this record
+    (it was redownloaded with corrected values, or observations were dropped or added before its end by the quality control)
+    """
+    if not os.path.exists(fn):
+        return None
+    state=pd.read_pickle(fn)
+    if len(state)!=3 or not isinstance(state[1],str): # saved by an earlier version
+        return None
+    [n,key,frames]=state
+    if n==0 or len(time)<n or fingerprint(time[:n],temp[:n])!=key: # also the case for the times-only digest of earlier versions
+        return None
+    return n,frames
+
+def write_state(fn,time,temp,frames):
+    # saves the frames of the observations "temp" at "time" (sorted) for "update_frames" next run
+    os.makedirs(os.path.dirname(fn) or '.',exist_ok=True)
+    tmp=fn+'.'+str(os.getpid()) # written aside and then renamed so an interrupted run never leaves half a file
+    pd.to_pickle([len(time),fingerprint(time,temp),frames],tmp)
+    os.replace(tmp,fn)
+
+def climatologies(frames,masks):
+    """
+    adds the daily ('dc') and monthly ('mc') climatologies to "frames"
+    made from the daily and monthly means after the masked rows are set to NaN
+    """
+    # daily climatology from the daily means with all the days put in the same (leap) year, 2000
+    daymean=np.where(masks['da'],np.nan,frames['da']['mean'].values)
+    mm,dd=month_of(frames['da'].index.values.astype('datetime64[D]'))
+    day2000=(np.datetime64('2000-01','M')+(mm-1)).astype('datetime64[D]')+(dd-1)
+    code=(day2000-day2000.min()).astype(int)
+    dc=group_stats(code,daymean,code.max()+1)
+    frames['dc']=stats_frame(dc,pd.date_range(day2000.min(),periods=code.max()+1,freq='D'))
+
+    # monthly climatology from the monthly means, indexed by the end of each month in 2000
+    monthmean=np.where(masks['ma'],np.nan,frames['ma']['mean'].values)
+    code=frames['ma'].index.month.values-1
+    code0=code.min()
+    mc=group_stats(code-code0,monthmean,code.max()-code0+1)
+    start=(np.datetime64('2000-01','M')+code0).astype('datetime64[D]')
+    frames['mc']=stats_frame(mc,pd.date_range(start,periods=code.max()-code0+1,freq=pd.offsets.MonthEnd()))
+
+def sketch_median(bins,counts):
+    # median of the values summarized as sorted "bins" (in hundredths) each seen "counts" times
+    n=np.sum(counts)
+    if n==0:
+        return np.nan
+    cum=np.cumsum(counts)
+    lo,hi=bins[np.searchsorted(cum,(n-1)//2,side='right')],bins[np.searchsorted(cum,n//2,side='right')]
+    return (lo+hi)/200.
+
+def merge_sketch(a,b):
+    # adds two (bins,counts) histograms
+    bins,inv=np.unique(np.concatenate([a[0],b[0]]),return_inverse=True)
+    return bins,np.bincount(inv,weights=np.concatenate([a[1],b[1]])).astype(np.int64)
+
+class DailyStats:
+    """
+    running per-day count, sum, sum of squares, min, max, median, mean, and std of a time-ordered series
+    fed in chunks with "add", so a site's whole record never has to be in memory at once
+
+    Only the current (possibly unfinished) day's values are buffered, so the daily stats are exact
+    and the same as "aggregate". The monthly and annual stats are derived from the daily sums at the end:
+    their counts, mins, and maxes are the same, their means and stds agree to rounding (they come from sums of squares),
+    and their medians come from a histogram at 0.01 resolution kept for each month (see "tests/test_stream.py").
+    """
+    fields=['count','n','sum','sumsq']+stats[1:]
+
+    def __init__(self):
+        self.day=[]
+        self.daily={k:[] for k in self.fields}
+        self.sketch={} # month -> (bins in hundredths,counts)
+        self.pending_time=np.array([],dtype='datetime64[s]')
+        self.pending_temp=np.array([])
+        self.depthsum,self.depthn=0.,0
+
+    def add(self,time,temp,depth=None):
+        # fold in the next chunk of observations (in time order, continuing where the last chunk ended)
+        if depth is not None:
+            depth=np.asarray(depth,dtype=float)
+            self.depthsum+=np.nansum(depth)
+            self.depthn+=np.sum(~np.isnan(depth))
+        time=np.concatenate([self.pending_time,np.asarray(time).astype('datetime64[s]')])
+        temp=np.concatenate([self.pending_temp,np.asarray(temp,dtype=float)])
+        if len(time)==0:
+            return
+        days=time.astype('datetime64[D]')
+        i=np.searchsorted(days,days[-1]) # the last day may go on in the next chunk
+        self.pending_time,self.pending_temp=time[i:],temp[i:]
+        self.fold(days[:i],temp[:i])
+
+    def finish(self):
+        # folds in the last day and returns self
+        self.fold(self.pending_time.astype('datetime64[D]'),self.pending_temp)
+        self.pending_time,self.pending_temp=self.pending_time[:0],self.pending_temp[:0]
+        return self
+
+    def fold(self,days,temp):
+        if len(days)==0:
+            return
+        code=(days-days[0]).astype(int)
+        ngroups=code[-1]+1
+        g=group_stats(code,temp,ngroups)
+        ok=~np.isnan(temp)
+        g['n']=np.bincount(code[ok],minlength=ngroups)
+        g['sum']=np.bincount(code[ok],weights=temp[ok],minlength=ngroups)
+        g['sumsq']=np.bincount(code[ok],weights=temp[ok]**2,minlength=ngroups)
+        present=g['count']>0
+        self.day.append(days[0]+np.arange(ngroups)[present])
+        for k in self.fields:
+            self.daily[k].append(g[k][present])
+        months=days[ok].astype('datetime64[M]')
+        hundredths=np.round(temp[ok]*100).astype(np.int64)
+        for month in np.unique(months):
+            new=np.unique(hundredths[months==month],return_counts=True)
+            self.sketch[month]=merge_sketch(self.sketch[month],new) if month in self.sketch else new
+
+    def depth(self):
+        # mean depth of the observations added
+        return self.depthsum/self.depthn if self.depthn else np.nan
+
+    def aggregate(self,minnumperday,minnumpermonth,site=''):
+        # same as "aggregate" but from the daily sums (see the class notes about the medians)
+        day=np.concatenate(self.day)
+        daily={k:np.concatenate(self.daily[k]) for k in self.fields}
+        frames={}
+        code=(day-day[0]).astype(int)
+        d={k:np.full(code[-1]+1,np.nan) for k in stats[1:]}
+        d['count']=np.zeros(code[-1]+1,dtype=np.int64)
+        for k in stats:
+            d[k][code]=daily[k]
+        frames['da']=stats_frame(d,pd.date_range(day[0],periods=code[-1]+1,freq='D'))
+
+        months=day.astype('datetime64[M]')
+        code=(months-months[0]).astype(int)
+        m=self.combine(code,code[-1]+1,daily,[self.sketch.get(mo,(np.array([],dtype=np.int64),)*2) for mo in months[0]+np.arange(code[-1]+1)])
+        frames['ma']=stats_frame(m,pd.period_range(str(months[0]),periods=code[-1]+1,freq='M'))
+
+        years=day.astype('datetime64[Y]')
+        code=(years-years[0]).astype(int)
+        yearsketch=[]
+        for yr in years[0]+np.arange(code[-1]+1):
+            sk=(np.array([],dtype=np.int64),)*2
+            for mo,s in self.sketch.items():
+                if mo.astype('datetime64[Y]')==yr:
+                    sk=merge_sketch(sk,s)
+            yearsketch.append(sk)
+        y=self.combine(code,code[-1]+1,daily,yearsketch)
+        frames['ya']=stats_frame(y,pd.period_range(str(years[0]),periods=code[-1]+1,freq='Y'))
+        return aggregate_frames(frames,minnumperday,minnumpermonth,site)
+
+    @staticmethod
+    def combine(code,ngroups,daily,sketches):
+        # monthly or annual stats from the daily sums where "code" puts each day in its month or year
+        out={}
+        out['count']=np.bincount(code,weights=daily['count'],minlength=ngroups).astype(np.int64)
+        n=np.bincount(code,weights=daily['n'],minlength=ngroups)
+        s=np.bincount(code,weights=daily['sum'],minlength=ngroups)
+        ss=np.bincount(code,weights=daily['sumsq'],minlength=ngroups)
+        with np.errstate(invalid='ignore',divide='ignore'):
+            out['mean']=np.where(n>0,s/n,np.nan)
+            out['std']=np.where(n>1,np.sqrt(np.maximum(ss-s*s/n,0)/(n-1)),np.nan)
+        out['min']=np.full(ngroups,np.nan); out['max']=np.full(ngroups,np.nan)
+        np.fmin.at(out['min'],code,daily['min'])
+        np.fmax.at(out['max'],code,daily['max'])
+        out['median']=np.array([sketch_median(*sk) for sk in sketches])
+        return out
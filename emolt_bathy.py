@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Isobaths for "plot_mostdata.py" precomputed from the FVCOM GOM3 grid
+
+Rather than reading the whole remote grid and contouring it every time the map is drawn,
+the grid is read once, clipped to the map's box, contoured, and the lines saved (as lon/lat vertices)
+in a small compressed numpy file that the map then just draws.
+
+run once (or whenever the box or depths change) as: python emolt_bathy.py
+"""
+import os
+import numpy as np
+
+fvcom_url='http://www.smast.umassd.edu:8080/thredds/dodsC/fvcom/hindcasts/30yr_gom3'
+isobath_file='./cache/isobaths_gom3.npz'
+
+def clip_grid(lons,lats,depths,gbox,margin=0.5):
+    # the grid nodes inside gbox=[minlon,maxlon,minlat,maxlat] plus a margin so the lines run off the edges
+    inside=(lons>=gbox[0]-margin)&(lons<=gbox[1]+margin)&(lats>=gbox[2]-margin)&(lats<=gbox[3]+margin)
+    return lons[inside],lats[inside],depths[inside]
+
+def isobaths(lons,lats,depths,depthint=[100.,200.]):
+    """
+    returns {depth: (n,2) array of lon/lat vertices} with a row of NaN between separate lines
+    contouring the nodes over their Delaunay triangulation as tricontour does
+    """
+    from matplotlib.figure import Figure # only needed to make the file
+    from matplotlib.tri import Triangulation
+    tri=Triangulation(lons,lats)
+    cs=Figure().add_subplot().tricontour(tri,depths,depthint)
+    lines={}
+    for level,segs in zip(depthint,cs.allsegs):
+        gap=np.full((1,2),np.nan)
+        lines[level]=np.concatenate([np.concatenate([seg,gap]) for seg in segs]) if segs else np.empty((0,2))
+    return lines
+
+def save_isobaths(fn,lines,gbox):
+    os.makedirs(os.path.dirname(fn) or '.',exist_ok=True)
+    np.savez_compressed(fn,gbox=gbox,depths=list(lines),**{'d'+str(k):lines[level] for k,level in enumerate(lines)})
+
+def load_isobaths(fn,gbox=None):
+    # returns {depth: lon/lat vertices} saved by "make_isobaths" (checking they were made for this box)
+    with np.load(fn) as z:
+        if gbox is not None and not np.allclose(z['gbox'],gbox):
+            raise ValueError(fn+' was made for box '+str([float(x) for x in z['gbox']])+', run make_isobaths for '+str(gbox))
+        return {float(level):z['d'+str(k)] for k,level in enumerate(z['depths'])}
+
+def make_isobaths(gbox,depthint=[100.,200.],fn=isobath_file,url=fvcom_url):
+    # reads the FVCOM grid, clips it to gbox, and saves the isobaths
+    import netCDF4
+    nc=netCDF4.Dataset(url).variables
+    lons,lats,depths=clip_grid(np.asarray(nc['lon'][:]),np.asarray(nc['lat'][:]),np.asarray(nc['h'][:]),gbox)
+    lines=isobaths(lons,lats,depths,depthint)
+    save_isobaths(fn,lines,gbox)
+    return lines
+
+if __name__=='__main__':
+    make_isobaths([-74.,-66.,35.,45.]) # the "gbox" of plot_mostdata.py
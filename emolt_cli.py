@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+One command for the three eMOLT climatology routines, each a subcommand with the options of its script:
+  python emolt_cli.py survey [--per-site] ...           counts every site's data ("getemolt_mostdata.py")
+  python emolt_cli.py climatology [SITE ...] [--qc] ...  NERACOOS csv files and plots ("clim.py")
+  python emolt_cli.py map [--save map.png] ...           map of the sites worth posting ("plot_mostdata.py")
+Only the map needs Basemap (and netCDF4 the first time, see "emolt_bathy.py") and only it and the plots load matplotlib,
+so these are imported when the subcommand that uses them runs rather than at startup.
+"""
+import argparse
+import clim
+import getemolt_mostdata
+import plot_mostdata
+
+commands={'survey':(getemolt_mostdata,'count the eMOLT data on ERDDAP for every site in the lookup table'),
+          'climatology':(clim,'generate the NERACOOS climatology csv files and plots for eMOLT sites'),
+          'map':(plot_mostdata,'map the eMOLT sites with the longest and most recent records')}
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description='eMOLT bottom temperature climatologies')
+    subparsers=parser.add_subparsers(dest='command',required=True)
+    for name,(module,description) in commands.items():
+        module.add_arguments(subparsers.add_parser(name,help=description,description=description))
+    args=parser.parse_args(argv)
+    return commands[args.command][0].run(args,parser)
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+Routines shared by "clim.py" and "getemolt_mostdata.py" to get eMOLT data from the NEFSC ERDDAP server
+
+Each site's hourly history is kept in a local cache file (compressed numpy, one per lat/lon)
+so that a rerun only asks ERDDAP for the rows after the last cached time and appends them.
+Delete a site's cache file to force a full download.
+For records too long to hold in memory, "getobs_chunks" streams a site straight from ERDDAP instead.
+For the survey of all sites, "getcounts_sites" asks ERDDAP for just the counts and time spans.
+All the requests go through "client" (see "ErddapClient") which keeps the connections open between requests,
+asks for gzip, retries what fails along the way, and tells "no data" (NoData) apart from "could not get it" (FetchError).
+As urllib did, it goes through the proxies of HTTP_PROXY and HTTPS_PROXY (except for the hosts of NO_PROXY) and follows redirects.
+"""
+import io
+import os
+import gzip
+import time
+import zlib
+import base64
+import threading
+import http.client
+import urllib.request
+from urllib.parse import urlsplit,urljoin,unquote
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+erddap_url='https://comet.nefsc.noaa.gov/erddap/tabledap/eMOLT.csvp' # point this at a local stand-in for testing (looked up at each call where url=None)
+erddap_cols=['time (UTC)','depth (m)','sea_water_temperature (degree_C)']
+timeout=120. # seconds ERDDAP may take to connect or to send the next piece of a response
+retries=3    # times a request is tried again after a dropped connection, timeout, or server error
+backoff=2.   # seconds before the first retry, doubled for each one after that
+redirects=5  # redirects followed for a request (e.g., when the server moves from http to https)
+
+nomatch=b'Your query produced no matching results' # how ERDDAP words the 404 of a query that matches nothing
+
+class NoData(Exception):
+    # ERDDAP answered that nothing matches the query (a 404 "Your query produced no matching results")
+    pass
+
+class FetchError(Exception):
+    # ERDDAP could not be reached or kept failing, so whether there is data is not known
+    pass
+
+class Retry(Exception):
+    # a server error worth trying again (5xx or 429)
+    pass
+
+transient=(OSError,http.client.HTTPException,EOFError,zlib.error,Retry) # what a retry might get past
+
+class Inflated(io.RawIOBase):
+    # reads a deflate (zlib) encoded response as it arrives
+    def __init__(self,raw):
+        self.raw=raw
+        self.z=zlib.decompressobj(32+zlib.MAX_WBITS) # zlib or gzip header
+        self.buf=b''
+
+    def readable(self):
+        return True
+
+    def readinto(self,b):
+        while not self.buf:
+            data=self.raw.read(65536)
+            if not data:
+                self.buf=self.z.flush()
+                break
+            self.buf=self.z.decompress(data)
+        n=min(len(b),len(self.buf))
+        b[:n]=self.buf[:n]
+        self.buf=self.buf[n:]
+        return n
+
+def proxy_for(scheme,netloc):
+    """
+    the (host:port, headers) of the proxy to use for this scheme and host from the environment as urllib would pick it
+    (HTTP_PROXY, HTTPS_PROXY, and NO_PROXY) or None to connect directly
+    """
+    proxies=urllib.request.getproxies()
+    if scheme not in proxies or urllib.request.proxy_bypass(netloc):
+        return None
+    proxy=urlsplit(proxies[scheme] if '://' in proxies[scheme] else 'http://'+proxies[scheme])
+    headers={}
+    if proxy.username is not None:
+        login=unquote(proxy.username)+':'+unquote(proxy.password or '')
+        headers['Proxy-Authorization']='Basic '+base64.b64encode(login.encode()).decode()
+    return proxy.hostname+(':'+str(proxy.port) if proxy.port else ''),headers
+
+def decoded(resp):
+    # the body of a response undoing its Content-Encoding, still read as it arrives
+    encoding=(resp.getheader('Content-Encoding') or '').lower()
+    if encoding=='gzip':
+        return gzip.GzipFile(fileobj=resp)
+    if encoding=='deflate':
+        return io.BufferedReader(Inflated(resp))
+    return resp
+
+class ErddapClient:
+    """
+    GET requests with one keep-alive connection per host in each thread (the fetch threads of "clim.py --workers" each have their own),
+    gzip or deflate responses, a socket "timeout", up to "redirects" redirects followed,
+    and up to "retries" retries "backoff" seconds apart (doubling)
+    A 404 saying the query matched nothing raises NoData, while any other 404 (e.g., a mistyped or moved "erddap_url")
+    and anything still failing after the retries raises FetchError.
+    """
+    def __init__(self,timeout=timeout,retries=retries,backoff=backoff,redirects=redirects):
+        self.timeout,self.retries,self.backoff,self.redirects=timeout,retries,backoff,redirects
+        self.local=threading.local()
+
+    def connection(self,key):
+        """
+        this thread's connection to (scheme,host) and whether it was already used (and so may have been closed by the server)
+        where an http proxy is sent the whole url (see "get") and an https one is asked for a tunnel to the host
+        """
+        conns=self.local.__dict__.setdefault('conns',{})
+        if key in conns:
+            return conns[key],True
+        kind=http.client.HTTPSConnection if key[0]=='https' else http.client.HTTPConnection
+        proxy=proxy_for(*key)
+        if proxy is None:
+            conn=kind(key[1],timeout=self.timeout)
+            conn.prefix,conn.proxy_headers='',{}
+        else:
+            conn=kind(proxy[0],timeout=self.timeout)
+            if key[0]=='https':
+                conn.set_tunnel(key[1],headers=proxy[1])
+                conn.prefix,conn.proxy_headers='',{}
+            else:
+                conn.prefix,conn.proxy_headers=key[0]+'://'+key[1],proxy[1]
+        conns[key]=conn
+        return conn,False
+
+    def drop(self,key):
+        conn=self.local.__dict__.get('conns',{}).pop(key,None)
+        if conn is not None:
+            conn.close()
+
+    def get(self,url):
+        # one GET of "url" returning the connection key and the response (of any status)
+        parts=urlsplit(url)
+        key=(parts.scheme,parts.netloc)
+        conn,reused=self.connection(key)
+        try:
+            headers=dict(conn.proxy_headers,**{'Accept-Encoding':'gzip, deflate'})
+            conn.request('GET',conn.prefix+parts.path+('?'+parts.query if parts.query else ''),headers=headers)
+            return key,conn.getresponse()
+        except transient as e:
+            self.drop(key)
+            e.reused=reused
+            raise
+
+    def request(self,url):
+        # the connection key and the response (status 200) ready to read for "url", following any redirects
+        for hop in range(self.redirects+1):
+            key,resp=self.get(url)
+            if resp.status==200:
+                return key,resp
+            body=decoded(resp).read() # so the connection can take the next request
+            resp.read()
+            if resp.status in (301,302,303,307,308) and resp.getheader('Location'):
+                url=urljoin(url,resp.getheader('Location'))
+                continue
+            if resp.status==404 and nomatch in body: # any other 404 (e.g., an unknown dataset) is a FetchError
+                raise NoData(url)
+            if resp.status>=500 or resp.status==429:
+                raise Retry('HTTP '+str(resp.status)+' '+resp.reason)
+            raise FetchError('HTTP '+str(resp.status)+' '+resp.reason+' for '+url)
+        raise FetchError('more than '+str(self.redirects)+' redirects, the last to '+url)
+
+    def retrying(self,url,func):
+        # func(url) with retries after the transient failures, waiting longer each time
+        for attempt in range(self.retries+1):
+            try:
+                return func(url)
+            except transient as e:
+                if attempt==self.retries:
+                    raise FetchError(repr(e)+' after '+str(attempt+1)+' tries for '+url) from e
+                if not (attempt==0 and getattr(e,'reused',False)): # a kept connection the server had closed is just reopened
+                    time.sleep(self.backoff*2**attempt)
+
+    def read(self,url,parse):
+        """
+        returns parse(body) where "body" is the decoded response read as it arrives,
+        retrying the whole request if it fails part way through
+        """
+        def once(url):
+            key,resp=self.request(url)
+            try:
+                out=parse(decoded(resp))
+                resp.read() # whatever the parser left, so the connection can take the next request
+            except BaseException:
+                self.drop(key)
+                raise
+            return out
+        return self.retrying(url,once)
+
+    @contextmanager
+    def open(self,url):
+        """
+        the decoded body of a response to read as it arrives (as with "with client.open(url) as body:")
+        where only getting the response is retried since part of the body may already have been used
+        """
+        key,resp=self.retrying(url,self.request)
+        try:
+            yield decoded(resp)
+            resp.read()
+        except transient as e:
+            self.drop(key)
+            raise FetchError(repr(e)+' part way through '+url) from e
+        except BaseException:
+            self.drop(key)
+            raise
+
+client=ErddapClient()
+
+def getobs_url(lat,lon,since=None,url=None):
+    # builds the tabledap query for one site where "since" is an ISO time string to only get newer rows
+    query='?time,depth,sea_water_temperature&latitude='+str(lat)+'&longitude='+str(lon)+'+'
+    if since is not None:
+        query=query+'&time%3E'+since # "time>since"
+    return (url or erddap_url)+query+'&orderBy(%22time%22)'
+
+def getbox_url(lats,lons,summary,url=None):
+    # builds a tabledap query of lat/lon/time over the box around all the lats/lons with a server-side "summary" like orderByCount
+    query='?latitude,longitude,time'
+    query=query+'&latitude%3E='+str(np.nanmin(lats))+'&latitude%3C='+str(np.nanmax(lats)) # "latitude>=" and "latitude<="
+    query=query+'&longitude%3E='+str(np.nanmin(lons))+'&longitude%3C='+str(np.nanmax(lons))
+    return (url or erddap_url)+query+'&'+summary
+
+def read_erddap(url):
+    """
+    reads a tabledap csvp response, returning an empty dataframe when ERDDAP finds no matching rows
+    (raising FetchError if it cannot be had, see "ErddapClient")
+    Note: csvp has a single header row with the units in parentheses so we do not skip any rows here
+    """
+    try:
+        return client.read(url,pd.read_csv) # parsed as it arrives
+    except NoData: # this is how ERDDAP says "Your query produced no matching results"
+        return pd.DataFrame(columns=erddap_cols)
+
+def cache_file(cachedir,lat,lon):
+    return os.path.join(cachedir,str(lat)+'_'+str(lon)+'.npz')
+
+def read_cache(fn):
+    # returns time (datetime64[s] UTC), depth, and temperature (degC) arrays of a cache file
+    if not os.path.exists(fn):
+        return np.array([],dtype='datetime64[s]'),np.array([]),np.array([])
+    with np.load(fn) as z:
+        return z['time'],z['depth'],z['temp']
+
+def write_cache(fn,time,depth,temp):
+    tmp=fn+'.tmp.npz' # written aside and then renamed so an interrupted run never leaves half a file
+    np.savez_compressed(tmp,time=time,depth=depth,temp=temp)
+    os.replace(tmp,fn)
+
+def parse_time(times):
+    # vectorized parse of the ERDDAP ISO "time (UTC)" strings (one pass instead of dateutil on every row)
+    return pd.to_datetime(times,format='%Y-%m-%dT%H:%M:%SZ',utc=True).values.astype('datetime64[s]')
+
+def getobs_arrays_cached(lat,lon,cachedir='./cache/',url=None):
+    """
+    returns time (datetime64[s] UTC), depth (m), and temperature (degC) arrays for this lat/lon
+    but only downloads the rows newer than what is already in "cachedir"
+    """
+    os.makedirs(cachedir,exist_ok=True)
+    fn=cache_file(cachedir,lat,lon)
+    time,depth,temp=read_cache(fn)
+    since=None
+    if len(time)>0:
+        since=np.datetime_as_string(time[-1],unit='s',timezone='UTC')
+    df=read_erddap(getobs_url(lat,lon,since,url))
+    if len(df)>0:
+        time=np.concatenate([time,parse_time(df[erddap_cols[0]])])
+        depth=np.concatenate([depth,df[erddap_cols[1]].values]).astype(np.float32)
+        temp=np.concatenate([temp,df[erddap_cols[2]].values]).astype(float)
+        write_cache(fn,time,depth,temp)
+        print(str(len(df))+' new rows since '+str(since))
+    return time,depth.astype(np.float32),temp
+
+def obs_frame(time,depth,temp):
+    """
+    shared fast loader for both scripts: returns a dataframe of "temp" (degF) and "Depth" indexed by UTC time
+    Note: depth is kept as float32 but temperature stays float64 since float32 changes the rounding of the csv products
+    """
+    temp=np.array(temp,dtype=float) # a copy so the caller's (or the cache's) degC array is left alone
+    temp*=1.8
+    temp+=32 # converts to degF
+    index=pd.DatetimeIndex(time).tz_localize('UTC')
+    return pd.DataFrame({'temp':temp,'Depth':np.asarray(depth,dtype=np.float32)},index=index)
+
+def getobs_latlon_cached(lat,lon,cachedir='./cache/',url=None):
+    # returns this site's observations as degF and depth indexed by time (see "obs_frame")
+    return obs_frame(*getobs_arrays_cached(lat,lon,cachedir,url))
+
+def getobs_chunks(lat,lon,chunksize=100000,url=None):
+    """
+    yields time (datetime64[s] UTC), depth, and temperature (degF) arrays for this lat/lon "chunksize" rows at a time
+    parsing the ERDDAP response as it arrives (the cache is not used since it holds the whole record)
+    """
+    try:
+        with client.open(getobs_url(lat,lon,url=url)) as body:
+            for df in pd.read_csv(body,chunksize=chunksize): # given the open response, pandas reads it a piece at a time
+                temp=df[erddap_cols[2]].values.astype(float)
+                temp*=1.8
+                temp+=32 # converts to degF
+                yield parse_time(df[erddap_cols[0]]),df[erddap_cols[1]].values.astype(np.float32),temp
+    except NoData: # no data for this site
+        return
+
+def getcounts_sites(lats,lons,url=None):
+    """
+    returns the number of points, the number of years spanned, and the last year for each lat/lon
+    from two small server-side summaries over the box around all of them (orderByCount and orderByMinMax)
+    instead of downloading every site's data (0,0,0 where ERDDAP has nothing)
+    """
+    counts=read_erddap(getbox_url(lats,lons,'orderByCount(%22latitude,longitude%22)',url))
+    spans=read_erddap(getbox_url(lats,lons,'orderByMinMax(%22latitude,longitude,time%22)',url))
+    key=lambda la,lo: (round(float(la),4),round(float(lo),4)) # so 4300.5 and 4300.50 match
+    npts={key(la,lo):int(n) for la,lo,n in counts.iloc[:,:3].values}
+    spans['t']=parse_time(spans.iloc[:,2])
+    tmin,tmax={},{}
+    for la,lo,t in spans[[spans.columns[0],spans.columns[1],'t']].values:
+        k=key(la,lo)
+        tmin[k]=min(t,tmin.get(k,t)); tmax[k]=max(t,tmax.get(k,t))
+    out=[]
+    for la,lo in zip(lats,lons):
+        k=key(la,lo)
+        if npts.get(k,0)==0 or k not in tmax:
+            out.append((0,0,0))
+        else:
+            out.append((npts[k],(pd.Timestamp(tmax[k])-pd.Timestamp(tmin[k])).days/365,pd.Timestamp(tmax[k]).year))
+    return out
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Typed columnar copies of the csv products "clim.py" writes for each site (see "clim.py --output")
+
+The five products of a site go in one table with a "product" column ('da','ma','ya','dc','mc')
+and int16 yy/mm/dd, int32 count, and float32 stats so they can be read back without parsing text:
+  npz: one compressed numpy file per site, "SITE_wtmp_DEPTH.npz", with an array per column
+  parquet: one dataset of all the sites, "wtmp.parquet/site=SITE/SITE_DEPTH.parquet" (needs pyarrow or fastparquet)
+           read with pd.read_parquet(outdir+'wtmp.parquet') to get them all with a "site" column
+"""
+import os
+import numpy as np
+import pandas as pd
+
+products=['da','ma','ya','dc','mc']
+columns=['yy','mm','dd','count','mean','median','min','max','std']
+dtypes=dict({'yy':np.int16,'mm':np.int16,'dd':np.int16,'count':np.int32},**{k:np.float32 for k in columns[4:]})
+
+def have_parquet():
+    # whether pandas has an engine to write parquet
+    for engine in ['pyarrow','fastparquet']:
+        try:
+            __import__(engine)
+            return True
+        except ImportError:
+            pass
+    return False
+
+def product_table(tables,depth):
+    """
+    one dataframe of the products given {product: dataframe with "columns"} as written to the csv files
+    where the NaN set in for the masked rows (as the string 'NaN' in some columns) become float NaN
+    """
+    parts=[]
+    for p in products:
+        df=pd.DataFrame({k:np.asarray(tables[p][k],dtype=float).astype(dtypes[k]) for k in columns})
+        df.insert(0,'product',p)
+        parts.append(df)
+    df=pd.concat(parts,ignore_index=True)
+    df.insert(1,'depth',np.int16(depth))
+    return df
+
+def write_npz(fn,df):
+    tmp=fn+'.tmp.npz' # written aside and then renamed so an interrupted run never leaves half a file
+    np.savez_compressed(tmp,**{k:df[k].values.astype('U2') if k=='product' else df[k].values for k in df.columns})
+    os.replace(tmp,fn)
+
+def write_parquet(outdir,site,depth,df):
+    # one file per depth, as with npz, so the products of "clim.py --split-depths" do not overwrite each other
+    dn=os.path.join(outdir,'wtmp.parquet','site='+site)
+    os.makedirs(dn,exist_ok=True)
+    fn=os.path.join(dn,site+'_'+str(depth)+'.parquet')
+    df.to_parquet(fn+'.tmp',index=False)
+    os.replace(fn+'.tmp',fn)
+
+def write_products(outdir,site,depth,tables,formats):
+    # writes the columnar copies of a site's products in each of "formats" ('npz' and/or 'parquet')
+    df=product_table(tables,depth)
+    if 'npz' in formats:
+        write_npz(os.path.join(outdir,site+'_wtmp_'+str(depth)+'.npz'),df)
+    if 'parquet' in formats:
+        write_parquet(outdir,site,depth,df)
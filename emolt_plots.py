@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Batch drawing of the three plots "clim.py" makes for each site (daily means, annual means, and the seasonal cycle)
+
+Rather than making (and showing) three new figures per site, each process makes the three figures once
+with the non-interactive Agg backend and, for every site, just replaces the line data, titles, and limits before saving.
+"""
+import numpy as np
+
+plotter=None # this process' SitePlotter, made on first use
+
+def use_batch_backend():
+    # no screen needed and nothing waits on a window
+    import matplotlib.pyplot as plt
+    plt.switch_backend('Agg')
+
+class SitePlotter:
+    """
+    the daily mean, annual mean, and monthly climatology figures reused from site to site
+    """
+    names=['_jt.png','_annual_clim.png','_seacycle.png']
+    titles=[' daily means',' annual means',' Monthly Climatology']
+
+    def __init__(self):
+        use_batch_backend()
+        import matplotlib.pyplot as plt
+        from matplotlib.dates import DateFormatter
+        self.figs,self.axes,self.lines=[],[],[]
+        for k in range(3):
+            fig,ax=plt.subplots()
+            if k==1: # annual mean
+                line,=ax.plot(np.array(['2000-01-01'],dtype='datetime64[D]'),[np.nan],marker='.',linewidth=2,markersize=20)
+            else:
+                line,=ax.plot(np.array(['2000-01-01'],dtype='datetime64[D]'),[np.nan]) # sets up the date axis
+            self.figs.append(fig);self.axes.append(ax);self.lines.append(line)
+        self.axes[2].xaxis.set_major_formatter(DateFormatter('%b'))
+
+    def plot(self,site,daily,annual,mclim,pltdir):
+        """
+        saves the three plots of a site where "daily" and "mclim" are series indexed by date
+        and "annual" is indexed by year (periods)
+        """
+        x=[daily.index.values,annual.index.to_timestamp().values,mclim.index.values]
+        for k,series in enumerate([daily,annual,mclim]):
+            self.lines[k].set_data(x[k],series.values)
+            self.axes[k].relim()
+            self.axes[k].autoscale_view()
+            self.axes[k].set_title(site+self.titles[k])
+            self.figs[k].savefig(pltdir+site+self.names[k])
+
+def draw_site(site,daily,annual,mclim,pltdir):
+    # draws a site with this process' SitePlotter
+    global plotter
+    if plotter is None:
+        plotter=SitePlotter()
+    plotter.plot(site,daily,annual,mclim,pltdir)
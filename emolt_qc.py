@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Quality control of a site's observations before "clim.py" averages them (see "clim.py --qc" and "--split-depths")
+
+Each check is a vectorized pass over the time-ordered arrays returning True for the samples kept:
+  in_water     depth not near the surface compared with the depths around it (the instrument hauled or on deck)
+  in_range     temperature within the limits possible on the bottom
+  not_spike    temperature not far from the running median of the samples around it
+  steady_rate  no isolated jump, i.e., the change per hour to both the sample before and after it is not too fast
+and "depth_clusters" splits a site with instruments at more than one depth so each depth gets its own products.
+"""
+import numpy as np
+import pandas as pd
+
+def rolling_median(x,window):
+    # centered running median over "window" samples (fewer at the ends and where there is NaN)
+    return pd.Series(x).rolling(window,center=True,min_periods=1).median().values
+
+def in_water(depth,window,mindepth,depthfrac):
+    # where depth is NaN, there is nothing to go on so the sample is kept
+    with np.errstate(invalid='ignore'):
+        return ~((depth<mindepth)|(depth<depthfrac*rolling_median(depth,window)))
+
+def in_range(temp,tmin,tmax):
+    with np.errstate(invalid='ignore'):
+        return (temp>=tmin)&(temp<=tmax) # NaN fails
+
+def not_spike(temp,window,spike):
+    return ~(np.abs(temp-rolling_median(temp,window))>spike)
+
+def steady_rate(time,temp,maxrate):
+    hours=(time-time[0]).astype('timedelta64[s]').astype(float)/3600
+    rate=np.abs(np.diff(temp))/np.maximum(np.diff(hours),1/60.) # per hour (repeated times taken as a minute apart)
+    fast=rate>maxrate
+    keep=np.ones(len(temp),dtype=bool)
+    keep[1:-1]=~(fast[:-1]&fast[1:])
+    return keep
+
+def qc_keep(time,temp,depth,limits):
+    """
+    returns True for the samples that pass all the checks where "limits" has
+    tmin, tmax, spike (temperature units), maxrate (temperature units per hour), mindepth (m),
+    depthfrac (the fraction of the running median depth below which the instrument is out of the water),
+    and window (samples in the running medians)
+    The spike and rate checks only see the samples that pass the depth and range checks.
+    """
+    keep=in_water(depth,limits['window'],limits['mindepth'],limits['depthfrac'])
+    keep&=in_range(temp,limits['tmin'],limits['tmax'])
+    i=np.flatnonzero(keep)
+    if len(i)>2:
+        ok=not_spike(temp[i],limits['window'],limits['spike'])&steady_rate(time[i],temp[i],limits['maxrate'])
+        keep[i[~ok]]=False
+    return keep
+
+def depth_clusters(depth,gap,minpts):
+    """
+    returns a boolean mask for each group of depths (shallowest first) where a group is split from the next
+    by more than "gap" meters with no samples in between and groups of fewer than "minpts" samples are dropped
+    """
+    d=np.round(depth)
+    ok=~np.isnan(d)
+    u=np.unique(d[ok])
+    breaks=u[1:][np.diff(u)>gap]
+    label=np.where(ok,np.searchsorted(breaks,np.where(ok,d,0),side='right'),-1)
+    counts=np.bincount(label[ok],minlength=len(breaks)+1)
+    return [label==k for k in range(len(counts)) if counts[k]>=minpts]
+
+def qc_site(time,temp,depth,limits=None,split=False,gap=10.,minpts=720):
+    """
+    returns a boolean mask of the samples to use for each set of products of a site:
+    one (all the samples or, with "limits", those passing "qc_keep") or, with split=True, one per depth cluster
+    where the depth clusters are found among the samples in the water (samples without a depth are left out)
+    and each is checked on its own
+    """
+    time=np.asarray(time); temp=np.asarray(temp,dtype=float); depth=np.asarray(depth,dtype=float)
+    if not split:
+        return [np.ones(len(time),dtype=bool) if limits is None else qc_keep(time,temp,depth,limits)]
+    wet=np.ones(len(time),dtype=bool) if limits is None else in_water(depth,limits['window'],limits['mindepth'],limits['depthfrac'])
+    sets=[]
+    for cluster in depth_clusters(np.where(wet,depth,np.nan),gap,minpts):
+        i=np.flatnonzero(cluster)
+        keep=np.zeros(len(time),dtype=bool)
+        keep[i]=True if limits is None else qc_keep(time[i],temp[i],depth[i],limits)
+        sets.append(keep)
+    return sets
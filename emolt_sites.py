@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Lookup of the eMOLT sites ("emolt_site.csv") shared by "clim.py" and "getemolt_mostdata.py"
+
+The table is read once per run (or from a pickle next to the ERDDAP cache that is redone whenever the csv changes)
+and indexed by the 4-digit SITE code so each site's lat/lon and other columns are a dictionary lookup.
+"""
+import os
+import tempfile
+import threading
+import pandas as pd
+
+class SiteRegistry:
+    """
+    the eMOLT site table indexed by SITE code where "sampling" has the per-site exceptions
+    to the standard samples per day as {site prefix: (numperday,minnumperday)}
+    """
+    def __init__(self,site_lookup,cachedir=None,sampling={}):
+        self.site_lookup=site_lookup
+        self.sampling=sampling
+        df=read_sites(site_lookup,cachedir).drop_duplicates('SITE') # the first row of a site is the one used
+        self.rows={site:row for site,row in zip(df['SITE'],df.to_dict('records'))}
+
+    def __contains__(self,site):
+        return site in self.rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def sites(self):
+        return list(self.rows)
+
+    def meta(self,site):
+        # all the columns of the lookup table for this site
+        if site not in self.rows:
+            raise KeyError('eMOLT site '+str(site)+' is not in '+self.site_lookup)
+        return self.rows[site]
+
+    def latlon(self,site):
+        row=self.meta(site)
+        return row['LAT_DDMM'],row['LON_DDMM']
+
+    def numperday(self,site,default):
+        # samples per day expected and the minimum needed for a daily average at this site
+        for prefix in self.sampling:
+            if str(site).startswith(prefix):
+                return self.sampling[prefix]
+        return default
+
+def read_sites(site_lookup,cachedir=None):
+    # reads the site table, using a pickled copy in "cachedir" when the csv has not changed since it was made
+    if cachedir is None:
+        return pd.read_csv(site_lookup)
+    stamp=os.stat(site_lookup)
+    fn=os.path.join(cachedir,os.path.basename(site_lookup)+'.pkl')
+    if os.path.exists(fn):
+        [mtime,size,df]=pd.read_pickle(fn)
+        if (mtime,size)==(stamp.st_mtime,stamp.st_size):
+            return df
+    df=pd.read_csv(site_lookup)
+    os.makedirs(cachedir,exist_ok=True)
+    fd,tmp=tempfile.mkstemp(suffix='.tmp',dir=cachedir) # each writer's own file, renamed in case another is reading it
+    with os.fdopen(fd,'wb') as f:
+        pd.to_pickle([stamp.st_mtime,stamp.st_size,df],f)
+    os.replace(tmp,fn)
+    return df
+
+registries={}
+lock=threading.Lock()
+
+def load_sites(site_lookup,cachedir=None,sampling={}):
+    # the registry of this site table, made once per process (the first of the fetch threads makes it while the others wait)
+    with lock:
+        if site_lookup not in registries:
+            registries[site_lookup]=SiteRegistry(site_lookup,cachedir,sampling)
+        return registries[site_lookup]
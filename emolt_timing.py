@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Optional per-site, per-stage timing for "clim.py" and "getemolt_mostdata.py" (see their "--report" option)
+
+Each stage of a site (fetch, stats, csv, plot, ...) records its wall time, the rows it handled, the resident memory (RSS)
+of the process at its start and end, and the stage's own peak RSS (the kernel's peak is reset as the stage starts, Linux only),
+and "write_report" saves them all as json or csv at the end of the run.
+The fetch threads of "--workers N" share a process so their memory figures overlap.
+When it is off (the default) "stage" just hands back one do-nothing timer, so the scripts run as before.
+With "profile" set to a site, each of that site's stages is also run under cProfile and dumped to "SITE_STAGE.prof"
+(view with "python -m pstats" or snakeviz).
+"""
+import os
+import sys
+import json
+import time
+import cProfile
+import pandas as pd
+try:
+    import resource # not on Windows
+except ImportError:
+    resource=None
+
+settings={'on':False,'profile':None,'profdir':'.'}
+records=[] # one dictionary per stage timed in this process
+fields=['site','stage','seconds','rows','rss_start_mb','rss_end_mb','stage_peak_rss_mb','pid','ok']
+
+def setup(on=True,profile=None,profdir='.'):
+    # turns the timing on (and cProfile for the "profile" site) for this process
+    settings.update(on=on,profile=profile,profdir=profdir)
+
+def peak_rss_mb():
+    # the peak RSS of this process since it started or, on Linux, since the last "reset_peak" (every timed stage starts with one)
+    if resource is None:
+        return None
+    peak=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak/2.**20 if sys.platform=='darwin' else peak/1024. # bytes on macOS, kB on Linux
+
+def rss_mb(field='VmRSS'):
+    # the RSS of this process now ('VmRSS') or its peak since the last "reset_peak" ('VmHWM'), None without /proc (macOS, Windows)
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field+':'):
+                    return int(line.split()[1])/1024. # kB
+    except OSError:
+        pass
+    return None
+
+def reset_peak():
+    # restarts the 'VmHWM' peak from the current RSS (Linux 4.0 on), returning whether it could
+    try:
+        with open('/proc/self/clear_refs','w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+class Timer:
+    """
+    times one stage of one site, used either as "with stage(site,name) as t:" or as "t=stage(site,name).start()" ... "t.done()"
+    where "rows" can be set (or given to "done") for the number of rows handled
+    """
+    def __init__(self,site,name):
+        self.site,self.name,self.rows=site,name,None
+        self.prof=None
+
+    def start(self):
+        if self.site is not None and self.site==settings['profile']:
+            self.prof=cProfile.Profile()
+            self.prof.enable()
+        self.rss0=rss_mb()
+        self.peaked=reset_peak()
+        self.t0=time.perf_counter()
+        return self
+
+    def done(self,rows=None,ok=True):
+        seconds=time.perf_counter()-self.t0
+        if self.prof is not None:
+            self.prof.disable()
+            self.prof.dump_stats(os.path.join(settings['profdir'],str(self.site)+'_'+self.name+'.prof'))
+        if rows is not None:
+            self.rows=rows
+        records.append({'site':self.site,'stage':self.name,'seconds':seconds,'rows':self.rows,'rss_start_mb':self.rss0,'rss_end_mb':rss_mb(),
+                        'stage_peak_rss_mb':rss_mb('VmHWM') if self.peaked else None,'pid':os.getpid(),'ok':ok})
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self,kind,value,tb):
+        self.done(ok=kind is None)
+        return False
+
+class NoTimer:
+    # what "stage" hands back when the timing is off
+    rows=None
+    def start(self):
+        return self
+    def done(self,rows=None,ok=True):
+        pass
+    def __enter__(self):
+        return self
+    def __exit__(self,kind,value,tb):
+        return False
+
+notimer=NoTimer()
+
+def stage(site,name):
+    return Timer(site,name) if settings['on'] else notimer
+
+def collect(opts,func,*args):
+    # runs func in a pool process with the parent's "settings" and returns what it returns along with the records it made
+    settings.update(opts)
+    del records[:]
+    out=func(*args)
+    return out,list(records)
+
+def write_report(fn):
+    """
+    writes the records of this run to "fn" (json if it ends in .json, otherwise csv)
+    and prints the total seconds and rows of each stage and the stage with the highest peak memory
+    """
+    df=pd.DataFrame(records,columns=fields)
+    for k in ['rows','rss_start_mb','rss_end_mb','stage_peak_rss_mb']:
+        df[k]=pd.to_numeric(df[k]) # None where a stage has no rows or the memory is not known
+    if fn.endswith('.json'):
+        with open(fn,'w') as f:
+            json.dump(records,f,indent=1)
+    else:
+        df.to_csv(fn,index=False)
+    if len(df):
+        print(df.groupby('stage',sort=False)[['seconds','rows']].sum().to_string())
+        if df['stage_peak_rss_mb'].notna().any():
+            top=df.loc[df['stage_peak_rss_mb'].idxmax()]
+            print('highest peak RSS %.1f MB in the %s stage of %s' % (top['stage_peak_rss_mb'],top['stage'],top['site']))
+        print('report in '+fn)
@@ -9,58 +9,94 @@ output  'site', 'lat', 'lon', 'npts', 'nyrs','maxyrs'
 rewritten in Fen 2024 after not finding the original one
 usually ran prior to "clim.py" to determine which sites to focus on
 """
-import matplotlib.pyplot as plt
 import numpy as np
 import warnings
 import pandas as pd
-import netCDF4
-import conda 
 import os
-conda_file_dir = conda.__file__
-conda_dir = conda_file_dir.split('lib')[0]
-proj_lib = os.path.join(os.path.join(conda_dir, 'share'), 'proj')
-from mpl_toolkits.basemap import Basemap
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from emolt_erddap import getobs_latlon_cached,getcounts_sites
+from emolt_sites import load_sites
+from emolt_timing import stage,setup,write_report
 warnings.filterwarnings("ignore")
 
 #HARDCODES
 site_lookup='/home/user/emolt_non_realtime/emolt/emolt_site.csv' # has lat/lon for each site
+cachedir='./cache/' # local copy of each site's ERDDAP data so reruns only fetch the new rows
 
-# Now, we get site's lat/lon from a lookup table and then access ERDDAP
-def getsite_latlon(df,site):
-    # get lat/lon ofr given 4-digit eMOLT site
-    df1=df[df['SITE']==site]
-    return df1['LAT_DDMM'].values[0],df1['LON_DDMM'].values[0]
-
+# Now, we get site's lat/lon from a lookup table (see "emolt_sites.py") and then access ERDDAP
 def getobs_count_latlon(lat,lon,site='AB01'):
     """
     Function written by Jim Manning to get emolt data from url, return # points
     this version needed in early 2024 when "site" was no longer served via ERDDAP & prepping clim.py
+    Modified Oct 2026 so a site ERDDAP could not be reached for is NaN rather than counted as having no data
     """
     try:
         print(site)
-        url = 'https://comet.nefsc.noaa.gov/erddap/tabledap/eMOLT.csvp?time,depth,sea_water_temperature&latitude='+str(lat)+'&longitude='+str(lon)+'+&orderBy(%22time%22)'
-        df=pd.read_csv(url,skiprows=[1])
-        npt=len(df)
-        df['datet']=pd.to_datetime(df['time (UTC)'])
-        maxyr=np.max(df['datet']).year# saves the last year
-        nyr=(np.max(df['datet'])-np.min(df['datet'])).days/365
-    except:
-        npt=0;nyr=0;maxyr=0
+        with stage(site,'fetch') as t: # timed when "--report" is given (see "emolt_timing.py")
+            df=getobs_latlon_cached(lat,lon,cachedir)
+            t.rows=len(df)
+    except Exception as e: # FetchError when ERDDAP could not be reached, or anything else about this site (e.g., an html error page)
+        print(site+' fetch failed: '+repr(e))
+        return np.nan,np.nan,np.nan
+    npt=len(df)
+    if npt==0: # no data for this site
+        return 0,0,0
+    maxyr=np.max(df.index).year# saves the last year
+    nyr=(np.max(df.index)-np.min(df.index)).days/365
     if nyr>10:
         print(lat,lon,site)
     return npt,nyr,maxyr
 
-#Main Code
-df=pd.read_csv(site_lookup)
-dfout=pd.DataFrame(columns=['site','lat','lon','npts','nyrs'])
-site,lat,lon,npts,nyrs,maxyrs=[],[],[],[],[],[]
-for k in range(len(df['SITE'])):
-    site.append(df['SITE'][k])
-    la,lo=getsite_latlon(df,df['SITE'].values[k])
-    lat.append(la);lon.append(lo)
-    npt,nyr,maxyr=getobs_count_latlon(la,lo,df['SITE'][k])
-    npts.append(npt);nyrs.append(nyr);maxyrs.append(maxyr)
-dfout['site']=site;dfout['lat']=lat;dfout['lon']=lon;dfout['npts']=npts;dfout['nyrs']=nyrs;dfout['maxyrs']=maxyrs
-dfout.to_csv('getemolt_mostdata.csv',index=None)
+def getobs_count_sites(sites,lats,lons,workers=1):
+    # runs "getobs_count_latlon" for every site with up to "workers" downloads at once, returning results in site order
+    with ThreadPoolExecutor(max(workers,1)) as pool:
+        return list(pool.map(getobs_count_latlon,lats,lons,sites))
 
+def survey(per_site=False,workers=1,outfile='getemolt_mostdata.csv'):
+    """
+    returns (and saves to "outfile") the site, lat, lon, number of points, years spanned, and last year of every site
+    from two small server-side summaries or, with per_site=True, by downloading each site (up to "workers" at once)
+    """
+    sites=load_sites(site_lookup,cachedir)
+    dfout=pd.DataFrame(columns=['site','lat','lon','npts','nyrs'])
+    site,lat,lon=[],[],[]
+    for s in sites.sites():
+        site.append(s)
+        la,lo=sites.latlon(s)
+        lat.append(la);lon.append(lo)
+    if per_site:
+        counts=getobs_count_sites(site,lat,lon,workers)
+    else:
+        with stage('all','survey') as t:
+            counts=getcounts_sites(lat,lon) # two small server-side summaries rather than every site's hourly data
+            t.rows=len(counts)
+    npts,nyrs,maxyrs=[list(x) for x in zip(*counts)]
+    failed=[s for s,n in zip(site,npts) if np.isnan(n)]
+    if failed:
+        print('could not get '+','.join(failed)+' from ERDDAP (left as NaN)')
+    dfout['site']=site;dfout['lat']=lat;dfout['lon']=lon;dfout['npts']=npts;dfout['nyrs']=nyrs;dfout['maxyrs']=maxyrs
+    dfout.to_csv(outfile,index=None)
+    return dfout
 
+def add_arguments(parser):
+    # the options of this script (also the "survey" command of "emolt_cli.py")
+    parser.add_argument('--per-site',action='store_true',help='download each site (through the cache) instead of asking ERDDAP for just the counts of all sites at once')
+    parser.add_argument('--workers',type=int,default=1,help='number of sites to download at the same time with --per-site')
+    parser.add_argument('--out',default='getemolt_mostdata.csv',help='the csv file to write')
+    parser.add_argument('--report',help='time each stage (and each site with --per-site) and save the timings to this json or csv file')
+    parser.add_argument('--profile',metavar='SITE',help='also run cProfile on this site with --per-site (or "all" for the survey) next to the report')
+
+def run(args,parser=None):
+    if args.report or args.profile:
+        setup(True,args.profile,os.path.dirname(args.report or '') or '.')
+    dfout=survey(args.per_site,args.workers,args.out)
+    if args.report:
+        write_report(args.report)
+    return dfout
+
+#Main Code
+if __name__=='__main__':
+    parser=argparse.ArgumentParser(description='count the eMOLT data on ERDDAP for every site in the lookup table')
+    add_arguments(parser)
+    run(parser.parse_args(),parser)
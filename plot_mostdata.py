@@ -5,34 +5,28 @@ Created on Wed Feb 21 11:25:37 2024
 plots the output of "getemolt_mostdata.py"
 @author: user
 """
-import matplotlib.pyplot as plt
 import warnings
 import pandas as pd
-import netCDF4
-import conda 
 import numpy as np
 import os
-conda_file_dir = conda.__file__
-conda_dir = conda_file_dir.split('lib')[0]
-proj_lib = os.path.join(os.path.join(conda_dir, 'share'), 'proj')
-from mpl_toolkits.basemap import Basemap
+import argparse
+from emolt_bathy import make_isobaths,load_isobaths
 warnings.filterwarnings("ignore")
 
 #HARDCODES
 gbox=[-74.,-66.,35.,45.]
 maxnyrs=20 # max number of years to span
 url='http://www.smast.umassd.edu:8080/thredds/dodsC/fvcom/hindcasts/30yr_gom3'
-nc = netCDF4.Dataset(url).variables
-lats = nc['lat'][:]
-lons = nc['lon'][:]
-depths = nc['h'][:] 
+isobath_file='./cache/isobaths_gom3.npz' # the isobaths of the FVCOM grid within gbox, made once by "emolt_bathy.py"
 depthint=[100.,200.]
 mode='isobaths'
 yrs=[10,20]
 maxyr_criteria=2023 #most recent  year
+relief_file='./cache/relief.npz' # shaded relief already warped to "gbox" so it is only made once
 
 
 def make_basemap(gbox,resolution='i'):
+    from mpl_toolkits.basemap import Basemap # only loaded when a map is made
     latsize=[gbox[2],gbox[3]]
     lonsize=[gbox[0],gbox[1]]
     '''
@@ -52,6 +46,27 @@ def make_basemap(gbox,resolution='i'):
     m.fillcontinents(color='gray')
     return m
 
+def shaded_relief(m,fn=relief_file):
+    # Basemap's shaded relief for this map, saved the first time so later runs just redraw the image
+    if os.path.exists(fn):
+        with np.load(fn) as z:
+            if np.array_equal(z['gbox'],gbox):
+                return m.imshow(z['rgba'])
+    im=m.shadedrelief()
+    os.makedirs(os.path.dirname(fn),exist_ok=True)
+    np.savez_compressed(fn,rgba=np.asarray(im.get_array()),gbox=gbox)
+    return im
+
+def plot_isobaths(m,ax,depthint=[100.,200.]):
+    # draws the precomputed isobaths, making them first if this is the first run
+    if not os.path.exists(isobath_file):
+        make_isobaths(gbox,depthint,isobath_file,url)
+    lines=load_isobaths(isobath_file,gbox)
+    for d in depthint:
+        x,y=m(lines[d][:,0],lines[d][:,1])
+        x[~np.isfinite(x)]=np.nan;y[~np.isfinite(y)]=np.nan # keeps the breaks between lines after the projection
+        ax.plot(x,y,'k--',linewidth=0.3,zorder=10)
+
 def plot_depth(m,lons,lats,depths,depthint=[100.,200.],mode='fill'):
     # uses FVCOM grid values
     # where "m" is a basemap object
@@ -63,41 +78,69 @@ def plot_depth(m,lons,lats,depths,depthint=[100.,200.],mode='fill'):
     lons = nc['lon'][:]
     depths = nc['h'][:]  # depth
     '''
+    import matplotlib.pyplot as plt
     xs,ys=m(lons,lats)
     if mode=='fill':
         plt.tricontourf(xs,ys,depths,[200.,1000.],colors='violet',zorder=0)
     else:
-        ax1.tricontour(xs,ys,depths,[200.],linewidths=0.3,linestyles='dashed',zorder=10)
+        plt.gca().tricontour(xs,ys,depths,[200.],linewidths=0.3,linestyles='dashed',zorder=10)
 
-#Main Code
-dfout=pd.read_csv('getemolt_mostdata.csv')
-fig, ax1 = plt.subplots()
+def plot_mostdata(infile='getemolt_mostdata.csv',yrs=yrs,maxyr_criteria=maxyr_criteria):
+    """
+    maps the sites in the output of "getemolt_mostdata.py" spanning more than each of "yrs" years
+    with those reaching "maxyr_criteria" marked and named, returning the figure
+    """
+    import matplotlib.pyplot as plt
+    dfout=pd.read_csv(infile)
+    fig, ax1 = plt.subplots()
 
-m=make_basemap(gbox)
-im1 = m.shadedrelief() # Value stored in a variable to resolve a bug
-im1.axes.add_image(im1)
-col=['k','r']
-for k in range(len(yrs)):
-    dfX=dfout[dfout['nyrs']>yrs[k]]
+    m=make_basemap(gbox)
+    im1 = shaded_relief(m) # Value stored in a variable to resolve a bug
+    im1.axes.add_image(im1)
+    col=['k','r']
+    for k in range(len(yrs)):
+        dfX=dfout[dfout['nyrs']>yrs[k]]
+        x,y=m(dfX.lon.values,dfX.lat.values)
+        m.scatter(x,y,zorder=0,color=col[k],label='spans >'+str(yrs[k])+' years')
+        if k==0:
+            bx=(max(x)-min(x))/20.
+            by=(max(y)-min(y))/20.
+            ax1.set_ylim(min(y)-by,max(y)+by)
+            ax1.set_xlim(min(x),max(x)+bx)
+
+    dfX=dfX[dfX['maxyrs']>=maxyr_criteria]
     x,y=m(dfX.lon.values,dfX.lat.values)
-    m.scatter(x,y,zorder=0,color=col[k],label='spans >'+str(yrs[k])+' years')
-    if k==0:
-        bx=(max(x)-min(x))/20.
-        by=(max(y)-min(y))/20.
-        ax1.set_ylim(min(y)-by,max(y)+by)
-        ax1.set_xlim(min(x),max(x)+bx)
-        
-dfX=dfX[dfX['maxyrs']>=maxyr_criteria]
-x,y=m(dfX.lon.values,dfX.lat.values)
-m.scatter(x,y,zorder=0,color=col[k],s=90)
-for i in range(len(dfX)):
-    ax1.annotate(dfX['site'].values[i], (x[i],y[i]),fontsize=6,fontweight='bold', xytext=(10, 0), textcoords='offset points')
-ax1.annotate('w/100 & 200 meter isobaths',(np.mean(x)-3*bx,np.min(y)+3*by),fontsize=6,fontweight='bold')
-ax1.set_title('non-realtime eMOLT hourly time series')
-plt.legend(loc='upper left')
-#    ax1.annotate(dfX['site'].values[i], xy=(float(x[i]), float(y[i])), xycoords='data', xytext=(x, y), textcoords='data')
-#for j in range(len(dfX)):
-#    ax1.text(x[j],y[j],dfX['site'].values[j],size=8,color='w')
-#plot_depth(m,lons,lats,depths,mode='isobaths')
-xs,ys=m(lons,lats)
-ax1.tricontour(xs,ys,depths,[100.,200.],linewidths=0.3,linestyles='dashed',zorder=10,colors=['k','k'])
+    m.scatter(x,y,zorder=0,color=col[k],s=90)
+    for i in range(len(dfX)):
+        ax1.annotate(dfX['site'].values[i], (x[i],y[i]),fontsize=6,fontweight='bold', xytext=(10, 0), textcoords='offset points')
+    ax1.annotate('w/100 & 200 meter isobaths',(np.mean(x)-3*bx,np.min(y)+3*by),fontsize=6,fontweight='bold')
+    ax1.set_title('non-realtime eMOLT hourly time series')
+    plt.legend(loc='upper left')
+    #    ax1.annotate(dfX['site'].values[i], xy=(float(x[i]), float(y[i])), xycoords='data', xytext=(x, y), textcoords='data')
+    #for j in range(len(dfX)):
+    #    ax1.text(x[j],y[j],dfX['site'].values[j],size=8,color='w')
+    #plot_depth(m,lons,lats,depths,mode='isobaths')
+    plot_isobaths(m,ax1,depthint)
+    return fig
+
+def add_arguments(parser):
+    # the options of this script (also the "map" command of "emolt_cli.py")
+    parser.add_argument('--csv',default='getemolt_mostdata.csv',help='output of "getemolt_mostdata.py" to map')
+    parser.add_argument('--yrs',type=int,nargs='+',default=yrs,help='spans of years to mark')
+    parser.add_argument('--maxyr',type=int,default=maxyr_criteria,help='sites with data in or after this year are named')
+    parser.add_argument('--save',help='save the map to this file instead of showing it')
+
+def run(args,parser=None):
+    import matplotlib.pyplot as plt
+    fig=plot_mostdata(args.csv,args.yrs,args.maxyr)
+    if args.save:
+        fig.savefig(args.save)
+    else:
+        plt.show()
+    return fig
+
+#Main Code
+if __name__=='__main__':
+    parser=argparse.ArgumentParser(description='map the eMOLT sites with the longest and most recent records')
+    add_arguments(parser)
+    run(parser.parse_args(),parser)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Regression test of the numpy stats of "emolt_agg.py" against the five "resample(...).agg({...})" calls clim.py used to make,
+on synthetic hourly and 2-hourly records with missing temperatures and gaps, including the NARR and WHAQ annual special cases
+
+The csv files must come out byte for byte the same, which rests on "running_stats" repeating pandas' order of
+operations for the means and stds that land on a rounding tie of '%10.2f' (see "near_half"),
+so a pandas upgrade that changes its groupby sums shows up here rather than in the published files.
+
+run from the top directory as: python -m pytest tests
+"""
+import os
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+import clim
+from emolt_agg import aggregate,near_half
+from emolt_erddap import obs_frame
+from benchmarks.synthetic import synthetic_record
+
+products=['da','ma','ya','dc','mc']
+output_fmt=['yy','mm','dd','count','mean','median','min','max','std']
+funcs={'count':np.size,'mean':np.mean,'median':np.median,'min':np.min,'max':np.max,'std':np.std} # as in the old clim.py
+
+def record(nyears,hours,start,seed,nanfrac=0.002):
+    # a synthetic record (see "benchmarks/synthetic.py") with some temperatures missing as a dataframe like "getobs_site" returns
+    time,depth,temp=synthetic_record(nyears,hours,start,seed)
+    temp[np.random.default_rng(seed).random(len(temp))<nanfrac]=np.nan
+    return obs_frame(time,depth,temp)
+
+def whaq_record():
+    # monthly samples before 1962, daily ones after (with a short year), and hourly since 2001 as at WHAQ
+    rng=np.random.default_rng(7)
+    monthly=np.arange('1959-01','1962-01',dtype='datetime64[M]').astype('datetime64[s]')+np.timedelta64(14,'D')
+    monthly=monthly[rng.random(len(monthly))>0.2] # some years short of 12
+    daily=np.arange('1962-01-01','1965-01-01',dtype='datetime64[D]').astype('datetime64[s]')+np.timedelta64(12,'h')
+    daily=daily[rng.random(len(daily))>0.03]
+    hourly=synthetic_record(2.5,1,'2000-08-03T07',seed=8)[0]
+    time=np.concatenate([monthly,daily,hourly])
+    temp=(10+6*np.sin(2*np.pi*time.astype('datetime64[D]').astype(float)/365.25)+rng.normal(0,0.5,len(time))).round(3)
+    return obs_frame(time,np.full(len(time),12.),temp)
+
+cases={ # site: (observations, numperday, minnumperday)
+    'SY01':(lambda: record(6,1,'2003-11-17T05',0),24,18),
+    'DMF1':(lambda: record(6,2,'2007-02-27T01',1),12,10),
+    'NARR':(lambda: record(4,1,'1999-03-09T13',2),24,18),
+    'WHAQ':(whaq_record,24,18),
+}
+
+def resample_products(tso,site,minnumperday,minnumpermonth):
+    # the five products as the old clim.py made them, masked and formatted for the csv files
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore',FutureWarning) # np.mean etc. in agg, 'M', 'A', and kind='period'
+        tsod=tso.resample('D').agg(funcs)
+        tsod.loc[tsod['count']<minnumperday,['mean','median','min','max','std']]='NaN'
+        tsom=tso.resample('M',kind='period').agg(funcs)
+        tsom.loc[tsom['count']<minnumpermonth,['mean','median','min','max','std']]='NaN'
+        tsoy=tso.resample('A',kind='period').agg(dict(funcs,mean=np.nanmean))
+        if site=='NARR':
+            tsoy.loc[(tsoy['count']<350)&(tsoy.index.year<2001),['mean','median','min','max','std']]='NaN'
+            tsoy.loc[(tsoy['count']<8000)&(tsoy.index.year>=2001),['mean','median','min','max','std']]='NaN'
+        elif site=='WHAQ':
+            tsoy.loc[(tsoy['count']<12)&(tsoy.index.year<1962),['mean','median','min','max','std']]='NaN'
+            tsoy.loc[(tsoy['count']<350)&(tsoy.index.year>=1962),['mean','median','min','max','std']]='NaN'
+            tsoy.loc[(tsoy['count']<8000)&(tsoy.index.year>=2001),['mean','median','min','max','std']]='NaN'
+        else:
+            tsoy.loc[tsoy['count']<0.8*np.max(tsoy['count']),['mean','median','min','max','std']]='NaN'
+        newindex=[t.replace(year=2000,tzinfo=None) for t in tsod['mean'].index]
+        tsdc=pd.Series(tsod['mean'].values,index=newindex).sort_index().astype(float).resample('D').agg(funcs)
+        newindex=[t.to_timestamp().replace(year=2000,tzinfo=None) for t in tsom['mean'].index]
+        tsmc=pd.Series(tsom['mean'].values,index=newindex).sort_index().astype(float).resample('M').agg(funcs)
+    for df,yy,dd in [(tsod,None,None),(tsom,None,15),(tsoy,None,31),(tsdc,0,None),(tsmc,0,None)]:
+        df['yy']=df.index.year if yy is None else yy
+        df['mm']=12 if df is tsoy else df.index.month
+        df['dd']=df.index.day if dd is None else dd
+        df['mean']=df['mean'].astype(float)
+        df['std']=df['std'].astype(float)
+    return {p:df.reindex(columns=output_fmt) for p,df in zip(products,[tsod,tsom,tsoy,tsdc,tsmc])}
+
+def csv_text(df):
+    return df.to_csv(index=False,header=False,na_rep='NaN',float_format='%10.2f')
+
+@pytest.mark.parametrize('site',list(cases))
+def test_stats_match_resample(site):
+    # the unmasked stats of "aggregate" are those of resample (to the last few bits) and the masks are where it set NaN
+    make,numperday,minnumperday=cases[site]
+    df=make()
+    tso=pd.Series(df.temp.values,index=df.index.values)
+    old=resample_products(tso,site,minnumperday,clim.mindayspermonth*numperday)
+    [tso_new,bad]=aggregate(df.index.values,df.temp.values,minnumperday,clim.mindayspermonth*numperday,site)
+    for p in products:
+        new=tso_new[p]
+        assert len(new)==len(old[p])
+        assert (new.index.month==old[p]['mm'].values).all() or p=='ya'
+        np.testing.assert_array_equal(new['count'].values,old[p]['count'].values)
+        masked=bad.get(p,np.zeros(len(new),dtype=bool))
+        for k in ['mean','median','min','max','std']:
+            want=np.asarray(old[p][k],dtype=float) # 'NaN' strings where masked
+            np.testing.assert_allclose(new[k].values[~masked],want[~masked],rtol=1e-12,atol=1e-12,equal_nan=True)
+            assert np.isnan(want[masked]).all()
+
+@pytest.mark.parametrize('site',list(cases))
+def test_csv_match_resample(site,tmp_path,monkeypatch):
+    # the csv files "clim.py" writes are the same text as those of the old resample path
+    make,numperday,minnumperday=cases[site]
+    df=make()
+    tso=pd.Series(df.temp.values,index=df.index.values)
+    old=resample_products(tso,site,minnumperday,clim.mindayspermonth*numperday)
+    monkeypatch.setattr(clim,'outdir',str(tmp_path)+'/')
+    monkeypatch.setattr(clim,'cachedir',str(tmp_path)+'/cache/')
+    monkeypatch.setattr(clim,'getsite_numperday',lambda site,thresholds=None: [numperday,minnumperday])
+    clim.clim_site(site,df,None,True)
+    depth=int(np.mean(df.Depth))
+    for p in products:
+        with open(os.path.join(str(tmp_path),site+'_wtmp_'+p+'_'+str(depth)+'.csv')) as f:
+            assert f.read()==csv_text(old[p]),p+' differs'
+
+def test_covers_rounding_ties():
+    # the records above have means and stds near a '%10.2f' tie, so the pandas-order recompute is exercised
+    ties=0
+    for site,(make,numperday,minnumperday) in cases.items():
+        df=make()
+        [tso,bad]=aggregate(df.index.values,df.temp.values,minnumperday,clim.mindayspermonth*numperday,site)
+        ties+=sum(np.sum(near_half(tso[p][k].values)) for p in products for k in ['mean','std'])
+    assert ties>0
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Test that "clim.py" reports a site as failed when "--qc" or "--split-depths" leave it nothing to average
+and that each fetch thread of "--workers N" tells whether its own site had data
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import clim
+from emolt_erddap import obs_frame,NoData
+from benchmarks.synthetic import synthetic_record
+
+@pytest.mark.parametrize('qc,split,tempshift,why',[
+    (False,True,0.,'no depth cluster'), # a month is not enough for a depth cluster
+    (True,False,60.,'quality control')]) # all out of range
+def test_nothing_to_average_fails(tmp_path,monkeypatch,capsys,qc,split,tempshift,why):
+    time,depth,temp=synthetic_record(0.05,1,seed=6) # about 2.5 weeks
+    df=obs_frame(time,depth,temp+tempshift)
+    monkeypatch.setattr(clim,'outdir',str(tmp_path)+'/')
+    monkeypatch.setattr(clim,'cachedir',str(tmp_path)+'/cache/')
+    monkeypatch.setattr(clim,'load_sites',lambda *args: None)
+    monkeypatch.setattr(clim,'getsite_numperday',lambda site,thresholds=None: [24,18])
+    monkeypatch.setattr(clim,'getobs_site',lambda site,stream=False: df)
+    failed=clim.clim_sites(['SY01'],plots='none',qc=qc,split=split)
+    assert list(failed)==['SY01'] and why in str(failed['SY01'])
+    assert not list(tmp_path.glob('*.csv'))
+
+def test_fetch_threads_count_their_own_rows(monkeypatch):
+    # an empty site fetched while another is still streaming must not make that one look empty
+    time,depth,temp=synthetic_record(0.05,1,seed=6)
+    emptied=threading.Event()
+    def chunks(lat,lon,chunksize):
+        if lat=='A':
+            yield time,depth,temp
+            emptied.wait(5) # site B is fetched in between
+        else:
+            emptied.set()
+            return
+            yield
+    monkeypatch.setattr(clim,'getsite_latlon',lambda site: (site,site))
+    monkeypatch.setattr(clim,'getobs_chunks',chunks)
+    with ThreadPoolExecutor(2) as pool:
+        a=pool.submit(clim.getobs_site,'A',True)
+        b=pool.submit(clim.getobs_site,'B',True)
+        with pytest.raises(NoData):
+            b.result()
+        assert len(a.result().day[0])>0
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Test that the stats "clim.py" keeps between runs (see "getsite_frames") give the same csv files as "--full"
+as a site's record grows on the local stand-in for ERDDAP (see "benchmarks/synthetic.py"):
+extended part way through a day, across a year boundary, and after a gap of several months,
+alternating incremental and full runs on the same cache
+"""
+import os
+import numpy as np
+import pytest
+import clim
+import emolt_erddap
+from benchmarks.synthetic import synthetic_record,serve
+
+latlon=(4130.5,-7001.25)
+time,depth,temp=synthetic_record(3,1,'2004-03-10T07',seed=3)
+gap=(time>=np.datetime64('2006-01-01T09'))&(time<np.datetime64('2006-05-20T00')) # the instrument out for months
+time,depth,temp=time[~gap],depth[~gap],temp[~gap]
+cuts=['2005-06-14T11:30', # part way through a day
+      '2005-12-31T20:00', # the last day of a year
+      '2006-01-01T09:00', # into the next one
+      '2006-08-15T13:00', # after the gap
+      '2007-03-10T00:00'] # the rest
+
+def run(outdir,full,qc,split,capsys):
+    # one "clim.py" run of the site writing its csv files to "outdir", returning them and whether it updated kept stats
+    os.makedirs(outdir,exist_ok=True)
+    clim.outdir=outdir+'/'
+    failed=clim.clim_sites(['SY01'],plots='none',full=full,qc=qc,split=split)
+    assert not failed,failed
+    texts={}
+    for fn in sorted(os.listdir(outdir)):
+        with open(os.path.join(outdir,fn),'rb') as f:
+            texts[fn]=f.read()
+    return texts,'new observations folded in' in capsys.readouterr().out
+
+@pytest.mark.parametrize('qc,split',[(False,False),(True,True)])
+def test_incremental_matches_full(tmp_path,monkeypatch,capsys,qc,split):
+    (tmp_path/'sites.csv').write_text('SITE,LAT_DDMM,LON_DDMM\nSY01,%s,%s\n' % latlon)
+    monkeypatch.setattr(clim,'site_lookup',str(tmp_path/'sites.csv'))
+    monkeypatch.setattr(clim,'cachedir',str(tmp_path/'cache')+'/')
+    monkeypatch.setattr(clim,'outdir',clim.outdir) # put back after the test ("run" sets it)
+    for k,cut in enumerate(cuts):
+        n=np.searchsorted(time,np.datetime64(cut))
+        server,url=serve({latlon:(time[:n],depth[:n],temp[:n])})
+        monkeypatch.setattr(emolt_erddap,'erddap_url',url)
+        try:
+            inc,updated=run(str(tmp_path/('inc%d' % k)),False,qc,split,capsys)
+            full,_=run(str(tmp_path/('full%d' % k)),True,qc,split,capsys)
+        finally:
+            server.shutdown()
+        assert len(inc)==5 and sorted(inc)==sorted(full)
+        for fn in inc:
+            assert inc[fn]==full[fn],cut+': '+fn+' differs'
+        # after the first, each run starts from the stats kept by the full run before it (with --qc the new samples
+        # can change the running medians of the last ones kept, and then it rightly starts over)
+        assert updated or k==0 or qc
+
+def test_corrected_redownload(tmp_path,monkeypatch,capsys):
+    # the cache deleted to redownload values ERDDAP has since corrected (same times) must not reuse the stats of the old ones
+    (tmp_path/'sites.csv').write_text('SITE,LAT_DDMM,LON_DDMM\nSY01,%s,%s\n' % latlon)
+    monkeypatch.setattr(clim,'site_lookup',str(tmp_path/'sites.csv'))
+    monkeypatch.setattr(clim,'cachedir',str(tmp_path/'cache')+'/')
+    monkeypatch.setattr(clim,'outdir',clim.outdir) # put back after the test ("run" sets it)
+    for k,shift in enumerate([0.,5.]):
+        server,url=serve({latlon:(time,depth,temp+shift)})
+        monkeypatch.setattr(emolt_erddap,'erddap_url',url)
+        if k>0:
+            os.remove(emolt_erddap.cache_file(clim.cachedir,*latlon))
+        try:
+            inc,_=run(str(tmp_path/('inc%d' % k)),False,False,False,capsys)
+            full,_=run(str(tmp_path/('full%d' % k)),True,False,False,capsys)
+        finally:
+            server.shutdown()
+        for fn in inc:
+            assert inc[fn]==full[fn],str(shift)+': '+fn+' differs'
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+Test of the site registry of "emolt_sites.py" when the fetch threads of "clim.py --workers N" all ask for it at once on a fresh cache
+"""
+import threading
+import emolt_sites
+
+def test_load_sites_threads(tmp_path,monkeypatch):
+    fn=tmp_path/'sites.csv'
+    fn.write_text('SITE,LAT_DDMM,LON_DDMM\n'+''.join('S%03d,%d,-7000\n' % (k,4000+k) for k in range(2000)))
+    failed=[]
+    for trial in range(10):
+        monkeypatch.setattr(emolt_sites,'registries',{})
+        cachedir=str(tmp_path/('cache%d' % trial))
+        def load():
+            try:
+                failed.append(emolt_sites.load_sites(str(fn),cachedir).latlon('S042')!=(4042,-7000))
+            except Exception as e:
+                failed.append(e)
+        threads=[threading.Thread(target=load) for k in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    assert not any(failed),failed
+    assert emolt_sites.read_sites(str(fn),cachedir)['SITE'].tolist()[:2]==['S000','S001'] # the pickled copy is whole
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Test that the running daily stats of "clim.py --stream" ("DailyStats" in "emolt_agg.py") give the same daily and
+daily climatology csv files as "aggregate" however the record is chunked (including chunks ending part way through a day),
+and the same monthly and annual stats but for the medians, which are good to 0.005 (the histogram is at 0.01)
+"""
+import os
+import numpy as np
+import pytest
+import clim
+from emolt_agg import aggregate,DailyStats
+from emolt_erddap import obs_frame
+from benchmarks.synthetic import synthetic_record
+
+time,depth,temp=synthetic_record(3,1,'2003-11-17T05',seed=5)
+temp[np.random.default_rng(5).random(len(temp))<0.002]=np.nan
+df=obs_frame(time,depth,temp) # degF as "getobs_chunks" gives them
+minnumperday,minnumpermonth=18,clim.mindayspermonth*24
+
+def write(tso,bad,outdir,monkeypatch):
+    # the csv text of the five products as "clim.py" writes them
+    monkeypatch.setattr(clim,'outdir',str(outdir)+'/')
+    os.makedirs(str(outdir))
+    clim.write_site('SY01',30,tso,bad)
+    texts={}
+    for p in ['da','ma','ya','dc','mc']:
+        with open(os.path.join(str(outdir),'SY01_wtmp_'+p+'_30.csv')) as f:
+            texts[p]=f.read()
+    return texts
+
+@pytest.mark.parametrize('chunksize',[len(df),100000,5000,1001,37])
+def test_stream_matches_aggregate(chunksize,tmp_path,monkeypatch):
+    assert chunksize>=len(df) or chunksize%24!=0 # so the chunks end part way through a day
+    stats=DailyStats()
+    for i in range(0,len(df),chunksize):
+        stats.add(df.index.values[i:i+chunksize],df.temp.values[i:i+chunksize],df.Depth.values[i:i+chunksize])
+    stats.finish()
+    [tso,bad]=stats.aggregate(minnumperday,minnumpermonth)
+    [tso0,bad0]=aggregate(df.index.values,df.temp.values,minnumperday,minnumpermonth)
+    for p in ['ma','ya']:
+        np.testing.assert_array_equal(bad[p],bad0[p])
+        for k in ['count','min','max']:
+            np.testing.assert_array_equal(tso[p][k].values,tso0[p][k].values)
+        for k in ['mean','std']:
+            np.testing.assert_allclose(tso[p][k].values,tso0[p][k].values,rtol=1e-9,equal_nan=True)
+        assert np.nanmax(np.abs(tso[p]['median'].values-tso0[p]['median'].values))<=0.005+1e-9
+    streamed=write(tso,bad,tmp_path/'stream',monkeypatch)
+    whole=write(tso0,bad0,tmp_path/'whole',monkeypatch)
+    for p in ['da','dc']:
+        assert streamed[p]==whole[p],p+' differs'
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Test of the survey of "getemolt_mostdata.py" through the local stand-in for ERDDAP (see "benchmarks/synthetic.py"):
+the orderByCount and orderByMinMax summaries over the box are joined back to each site of the lookup table,
+a site with no data gets 0,0,0, and the site table's lat/lon need not be written with the decimals ERDDAP uses
+"""
+import pandas as pd
+import pytest
+import emolt_erddap
+import getemolt_mostdata
+from benchmarks.synthetic import synthetic_record,serve
+
+records={ # (lat,lon) on ERDDAP: record
+    (4130.5,-7001.25):synthetic_record(1.5,1,'2003-11-17T05',seed=0),
+    (4129.0,-6995.0):synthetic_record(3.2,1,'2011-04-02T00',seed=1),
+    (4131.25,-6990.5):synthetic_record(2,2,'2019-12-30T22',seed=2),
+}
+table='''SITE,LAT_DDMM,LON_DDMM
+AA01,4130.5,-7001.25
+AA02,4128.99999,-6995.00001
+AA03,4131.25,-6990.50
+AA04,4130.0,-6999.0
+'''
+where={'AA01':(4130.5,-7001.25),'AA02':(4129.0,-6995.0),'AA03':(4131.25,-6990.5)} # AA04 has no data
+
+@pytest.fixture
+def standin(tmp_path,monkeypatch):
+    # the records served locally with the lookup table and cache in "tmp_path"
+    server,url=serve(records)
+    (tmp_path/'sites.csv').write_text(table)
+    monkeypatch.setattr(emolt_erddap,'erddap_url',url)
+    monkeypatch.setattr(getemolt_mostdata,'site_lookup',str(tmp_path/'sites.csv'))
+    monkeypatch.setattr(getemolt_mostdata,'cachedir',str(tmp_path/'cache')+'/')
+    yield tmp_path
+    server.shutdown()
+
+def expected(site):
+    if site not in where:
+        return 0,0,0
+    t=pd.to_datetime(records[where[site]][0])
+    return len(t),(t.max()-t.min()).days/365,t.max().year
+
+def test_survey_joins_summaries(standin):
+    df=getemolt_mostdata.survey(False,1,str(standin/'survey.csv')).set_index('site')
+    assert list(df.index)==['AA01','AA02','AA03','AA04']
+    for site in df.index:
+        assert tuple(df.loc[site,['npts','nyrs','maxyrs']])==expected(site),site
+    assert pd.read_csv(standin/'survey.csv')['npts'].tolist()==[expected(s)[0] for s in df.index]
+
+def test_survey_matches_per_site(standin):
+    # the summaries give what downloading each site does (AA02's noisy table lat/lon only matches after rounding, so is left out)
+    box=getemolt_mostdata.survey(False,1,str(standin/'box.csv')).set_index('site')
+    each=getemolt_mostdata.survey(True,2,str(standin/'each.csv')).set_index('site')
+    for site in ['AA01','AA03','AA04']:
+        assert tuple(box.loc[site,['npts','nyrs','maxyrs']])==tuple(each.loc[site,['npts','nyrs','maxyrs']]),site
+
+def test_per_site_failure_is_nan(standin,monkeypatch):
+    # a site that cannot be read (here an html error page in place of csv) is left as NaN and the others still counted
+    get=getemolt_mostdata.getobs_latlon_cached
+    def getobs(lat,lon,cachedir):
+        if (lat,lon)==where['AA03']:
+            raise pd.errors.ParserError('Error tokenizing data. C error: Expected 1 fields in line 12, saw 2')
+        return get(lat,lon,cachedir)
+    monkeypatch.setattr(getemolt_mostdata,'getobs_latlon_cached',getobs)
+    df=getemolt_mostdata.survey(True,2,str(standin/'each.csv')).set_index('site')
+    assert df.loc[['AA03'],['npts','nyrs','maxyrs']].isna().all(axis=None)
+    assert tuple(df.loc['AA01',['npts','nyrs','maxyrs']])==expected('AA01')
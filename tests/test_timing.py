@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+Test that the memory "emolt_timing.py" records for each stage is that stage's own, not the peak of the process so far
+"""
+import numpy as np
+import pytest
+import emolt_timing
+from emolt_timing import setup,stage,rss_mb,reset_peak,write_report
+
+@pytest.mark.skipif(rss_mb() is None or not reset_peak(),reason='needs Linux /proc')
+def test_stage_peaks(tmp_path,monkeypatch,capsys):
+    monkeypatch.setattr(emolt_timing,'records',[]) # keeps this test's records apart
+    setup(True)
+    try:
+        with stage('BIG','stats'):
+            x=np.ones(25_000_000) # 200 MB
+            del x
+        with stage('SMALL','stats'):
+            np.ones(1000).sum()
+        write_report(str(tmp_path/'run.json'))
+    finally:
+        setup(False)
+    big,small=emolt_timing.records
+    assert big['stage_peak_rss_mb']-big['rss_start_mb']>150
+    assert small['stage_peak_rss_mb']-small['rss_start_mb']<50 # the peak of the stage before is not carried over
+    assert abs(big['rss_end_mb']-small['rss_start_mb'])<50
+    assert 'in the stats stage of BIG' in capsys.readouterr().out